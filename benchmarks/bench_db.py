@@ -0,0 +1,93 @@
+"""Compare RedisClient with its old implementation.
+
+Pop: the atomic pop script against the old zrange/zscore/zrem path.
+Put: chunked multi-member zadd against one zadd per item.
+
+Usage:
+    PROXYPOOLER_CONFIG=proxypooler python benchmarks/bench_db.py [count ...]
+
+Make sure redis was running before benching, the pool in config.pool_name will be cleared.
+"""
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from proxypooler import config
+from proxypooler.db import RedisClient
+
+
+ROUNDS = 20
+
+
+def legacy_get_list(conn, count, rev=False):
+    """get_list before the pop script: one zscore for every item."""
+    db = conn._db
+    if not rev:
+        items = db.zrange(config.pool_name, 0, count - 1)
+    else:
+        items = db.zrevrange(config.pool_name, 0, count - 1)
+    items_expires = [(item, db.zscore(config.pool_name, item)) for item in items]
+    if items:
+        db.zrem(config.pool_name, *items)
+    return items_expires
+
+
+def legacy_put_list(conn, items):
+    """put_list before chunked zadd: one zadd for every item."""
+    for item, expire in items:
+        conn.put(item, expire)
+
+
+def fill(conn, count):
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(count)])
+
+
+def bench(conn, get_list, count):
+    elapsed = 0
+    for _ in range(ROUNDS):
+        fill(conn, count)
+        start = perf_counter()
+        items = get_list(count, rev=True)
+        elapsed += perf_counter() - start
+        assert len(items) == count
+    return elapsed / ROUNDS
+
+
+def bench_put(conn, put_list, count):
+    items = [('127.0.0.1:{}'.format(i), i) for i in range(count)]
+    elapsed = 0
+    for _ in range(ROUNDS):
+        start = perf_counter()
+        put_list(items)
+        elapsed += perf_counter() - start
+        assert conn.size == count
+        conn._db.delete(config.pool_name)
+    return elapsed / ROUNDS
+
+
+def main():
+    counts = [int(x) for x in sys.argv[1:]] or [1, 10, 100, 1000]
+    conn = RedisClient()
+    conn._db.delete(config.pool_name)
+
+    print('get_list')
+    print('{:>8} {:>14} {:>14} {:>8}'.format('count', 'legacy(ms)', 'script(ms)', 'speedup'))
+    for count in counts:
+        legacy = bench(conn, lambda c, rev: legacy_get_list(conn, c, rev), count)
+        script = bench(conn, conn.get_list, count)
+        print('{:>8} {:>14.3f} {:>14.3f} {:>7.1f}x'.format(
+            count, legacy * 1000, script * 1000, legacy / script))
+
+    print('put_list')
+    print('{:>8} {:>16} {:>16} {:>8}'.format('count', 'legacy(item/s)', 'chunked(item/s)', 'speedup'))
+    for count in counts:
+        legacy = bench_put(conn, lambda items: legacy_put_list(conn, items), count)
+        chunked = bench_put(conn, conn.put_list, count)
+        print('{:>8} {:>16.0f} {:>16.0f} {:>7.1f}x'.format(
+            count, count / legacy, count / chunked, legacy / chunked))
+
+
+if __name__ == '__main__':
+    main()
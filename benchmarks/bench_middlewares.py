@@ -0,0 +1,71 @@
+"""Compare ProxyPooler's fused middleware pipelines with calling middlewares one by one.
+
+put_list: pack, serialize, update_expire and put_in.
+get_list: saver's get_list, deserialize and unpack.
+
+MemorySaver was used so that the cost was mostly the pipelines'.
+
+Usage:
+    PROXYPOOLER_CONFIG=proxypooler python benchmarks/bench_middlewares.py [batch size ...]
+"""
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from proxypooler.db import MemorySaver
+from proxypooler.middlewares import deserialize, pack, put_in, serialize, unpack, update_expire
+from proxypooler.pooler import ProxyPooler
+
+
+TOTAL = 10**5 # items per measurement
+
+
+def legacy_put_list(p, items):
+    item, expire = items, None
+    for call in (pack, serialize, update_expire):
+        item, expire = call(item, expire)
+    put_in(item, expire, saver=p.saver, scheduler=p.scheduler)
+
+
+def legacy_get_list(p, count):
+    item, expire = p.saver.get_list(count), None
+    for call in (deserialize, unpack):
+        item, expire = call(item, expire)
+    return item
+
+
+def bench(size, put_list, get_list):
+    p = ProxyPooler(saver=MemorySaver())
+    batches = [[('127.0.0.1:{}'.format(n * size + i), 300) for i in range(size)]
+               for n in range(max(TOTAL // size, 1))]
+    count = len(batches) * size
+
+    start = perf_counter()
+    for items in batches:
+        put_list(p, items)
+    put = perf_counter() - start
+
+    start = perf_counter()
+    for _ in batches:
+        get_list(p, size)
+    get = perf_counter() - start
+    assert p.size == 0
+    return put / count * 10**6, get / count * 10**6
+
+
+def main():
+    sizes = [int(float(x)) for x in sys.argv[1:]] or [1, 100, 10**4]
+
+    print('{:>8} {:>16} {:>16} {:>16} {:>16}'.format(
+        'batch', 'put legacy(us)', 'put fused(us)', 'get legacy(us)', 'get fused(us)'))
+    for size in sizes:
+        legacy = bench(size, legacy_put_list, legacy_get_list)
+        fused = bench(size, ProxyPooler.put_list, ProxyPooler.get_list)
+        print('{:>8} {:>16.3f} {:>16.3f} {:>16.3f} {:>16.3f}'.format(
+            size, legacy[0], fused[0], legacy[1], fused[1]))
+
+
+if __name__ == '__main__':
+    main()
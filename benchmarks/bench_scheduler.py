@@ -0,0 +1,99 @@
+"""Compare finding due proxies by polling the sorted set with the timing wheel.
+
+For every size, items with expire spread over SPAN seconds were put into saver, then time
+was moved forward one second at a time until all items were dispatched:
+
+    polling: saver.get_due(now, validate_count) until less than validate_count returned.
+    wheel:   TimingWheel.advance(now) only.
+    wheel+claim: TimingWheel.advance(now) and saver.claim in batches of validate_count.
+
+Usage:
+    PROXYPOOLER_CONFIG=proxypooler python benchmarks/bench_scheduler.py [--memory] [size ...]
+
+Redis is used unless --memory is given, the pool in config.pool_name will be cleared.
+"""
+import sys
+from pathlib import Path
+from random import random
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from proxypooler import config
+from proxypooler.db import MemorySaver, RedisClient
+from proxypooler.scheduler import TimingWheel
+
+
+START = 10**9
+SPAN = 3600
+
+
+def make_items(size):
+    return [('{}'.format(i).encode('utf-8'), START + int(random() * SPAN)) for i in range(size)]
+
+
+def new_saver(memory):
+    if memory:
+        return MemorySaver()
+    saver = RedisClient()
+    saver._db.delete(config.pool_name)
+    return saver
+
+
+def bench_polling(saver, items):
+    saver.put_list(items)
+    count = config.validate_count
+    dispatched = 0
+    start = perf_counter()
+    for now in range(START, START + SPAN + 1):
+        while 1:
+            due = saver.get_due(now, count)
+            dispatched += len(due)
+            if len(due) < count:
+                break
+    elapsed = perf_counter() - start
+    assert dispatched == len(items)
+    return elapsed
+
+
+def bench_wheel(saver, items, claim):
+    if claim:
+        saver.put_list(items)
+    wheel = TimingWheel(now=START)
+    for item, expire in items:
+        wheel.add(item, expire)
+
+    count = config.validate_count
+    dispatched = 0
+    start = perf_counter()
+    for now in range(START, START + SPAN + 1):
+        due = [item for item, _ in wheel.advance(now)]
+        if claim:
+            for i in range(0, len(due), count):
+                claimed, _ = saver.claim(due[i:i + count], now)
+                dispatched += len(claimed)
+        else:
+            dispatched += len(due)
+    elapsed = perf_counter() - start
+    assert dispatched == len(items)
+    return elapsed
+
+
+def main():
+    args = sys.argv[1:]
+    memory = '--memory' in args
+    sizes = [int(float(x)) for x in args if x != '--memory'] or [10**5, 10**6, 10**7]
+
+    print('{:>10} {:>18} {:>18} {:>22}'.format('size', 'polling(us/item)',
+                                               'wheel(us/item)', 'wheel+claim(us/item)'))
+    for size in sizes:
+        items = make_items(size)
+        polling = bench_polling(new_saver(memory), items)
+        wheel = bench_wheel(None, items, claim=False)
+        wheel_claim = bench_wheel(new_saver(memory), items, claim=True)
+        print('{:>10} {:>18.3f} {:>18.3f} {:>22.3f}'.format(
+            size, polling / size * 10**6, wheel / size * 10**6, wheel_claim / size * 10**6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import struct
+from time import time
+
+from proxypooler import config
+from proxypooler.ext import serial
+
+
+def array_header(n):
+    """MessagePack header of an array with n elements."""
+    if n < 16:
+        return bytes([0x90 | n])
+    elif n < 2**16:
+        return b'\xdc' + struct.pack('>H', n)
+    else:
+        return b'\xdd' + struct.pack('>I', n)
+
+
+class ReadCache:
+    """In-process cache of the latest validated items to answer 'get N peek' from memory.
+
+    Every entry holds the unpacked (item, expire) and its serialized bytes, so a reply
+    was only an array header and a join. Items newer than the cached ones were merged
+    in every 'refresh' seconds, and the whole cache was reloaded every 'max_age' seconds
+    so that no entry was older than it. When there were more than 'size' entries,
+    the oldest validated ones were evicted.
+
+    Attributes:
+        hits: replies without calling saver.
+        misses: replies after loading or refreshing from saver.
+        evictions: entries evicted for size.
+    """
+
+    def __init__(self, size=config.cache_size, max_age=config.cache_max_age,
+                 refresh=config.cache_refresh):
+        self.size = size
+        self.max_age = max_age
+        self.refresh = refresh
+        self.entries = [] # [(score, (item, expire), serialized)], latest first
+        self.cursor = 0
+        self.loaded_at = None
+        self.refreshed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def needs_load(self):
+        return self.loaded_at is None or time() - self.loaded_at >= self.max_age
+
+    def needs_refresh(self):
+        return self.refreshed_at is None or time() - self.refreshed_at >= self.refresh
+
+    @property
+    def latest(self):
+        """Score of the latest validated entry, None if empty."""
+        return self.entries[0][0] if self.entries else None
+
+    @staticmethod
+    def _entries(items):
+        return [(score, item, serial(item)) for score, item in items]
+
+    def load(self, items):
+        """Replace all entries.
+
+        Args:
+            items: [(score, (item, expire)), ...] latest first.
+        """
+        self.entries = self._entries(items[:self.size])
+        self.loaded_at = self.refreshed_at = time()
+
+    def merge(self, items):
+        """Merge newer items like load's in, an item already cached was moved to the front."""
+        if items:
+            fresh = {item for _, item in items}
+            entries = self._entries(items)
+            entries.extend(entry for entry in self.entries if entry[1] not in fresh)
+            self.evictions += max(len(entries) - self.size, 0)
+            self.entries = entries[:self.size]
+        self.refreshed_at = time()
+
+    def get(self, count):
+        """Take count entries round-robin.
+
+        Returns:
+            (the number of items, serialized [(item, expire), ...]).
+        """
+        size = len(self.entries)
+        count = min(count, size)
+        if count <= 0:
+            return 0, None
+        start = self.cursor % size
+        self.cursor = start + count
+        entries = self.entries[start:start + count] + self.entries[:max(start + count - size, 0)]
+        return count, array_header(count) + b''.join(data for _, _, data in entries)
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,81 @@
+"""Compact encoding of packed items like {'item': proxy, 'expire': expire}.
+
+Proxy like 'ip:port' or '[ipv6]:port' with an integer expire was encoded in fixed
+binary behind MARKER, 0xc1 was never used by MessagePack, so compact and MessagePack
+members could be told apart by their first byte:
+
+    MARKER, 4, 4 bytes IPv4, port(2 bytes), expire(4 bytes) -- 12 bytes
+    MARKER, 6, 16 bytes IPv6, port(2 bytes), expire(4 bytes) -- 24 bytes
+
+Other items, such as hostnames, were left to MessagePack. Encoding of recent
+proxies was cached, so most of the cost was packing expire.
+"""
+import socket
+import struct
+
+
+MARKER = b'\xc1'
+IPV4 = struct.Struct('>cc4sH')
+IPV6 = struct.Struct('>cc16sH')
+EXPIRE = struct.Struct('>I')
+CACHE_SIZE = 100000 # proxies were validated again and again, cache their encoding
+
+_prefixes = {} # proxy -> encoded proxy, b'' if it could not be encoded
+_proxies = {} # encoded proxy -> proxy
+
+
+def _encode_proxy(proxy):
+    host, sep, port = proxy.rpartition(':')
+    if not sep or not port.isdigit() or port != str(int(port)) or int(port) >= 2**16:
+        return b''
+    try:
+        if host.startswith('[') and host.endswith(']'):
+            address = socket.inet_pton(socket.AF_INET6, host[1:-1])
+            if socket.inet_ntop(socket.AF_INET6, address) != host[1:-1]:
+                return b''
+            return IPV6.pack(MARKER, b'\x06', address, int(port))
+        address = socket.inet_pton(socket.AF_INET, host)
+    except (OSError, ValueError):
+        return b''
+    if socket.inet_ntop(socket.AF_INET, address) != host:
+        return b''
+    return IPV4.pack(MARKER, b'\x04', address, int(port))
+
+
+def _decode_proxy(data):
+    if data[1:2] == b'\x04':
+        _, _, address, port = IPV4.unpack(data)
+        return '{}:{}'.format(socket.inet_ntop(socket.AF_INET, address), port)
+    _, _, address, port = IPV6.unpack(data)
+    return '[{}]:{}'.format(socket.inet_ntop(socket.AF_INET6, address), port)
+
+
+def encode(item):
+    """Encode packed item, None if it could not be encoded compactly."""
+    proxy, expire = item.get('item'), item.get('expire')
+    if (len(item) != 2 or type(proxy) is not str or type(expire) is not int
+            or not 0 <= expire < 2**32):
+        return None
+    prefix = _prefixes.get(proxy)
+    if prefix is None:
+        if len(_prefixes) >= CACHE_SIZE:
+            _prefixes.clear()
+        prefix = _prefixes[proxy] = _encode_proxy(proxy)
+    if not prefix:
+        return None
+    return prefix + EXPIRE.pack(expire)
+
+
+def is_compact(data):
+    return data[:1] == MARKER
+
+
+def decode(data):
+    """Decode data encoded by encode."""
+    prefix = data[:-4]
+    proxy = _proxies.get(prefix)
+    if proxy is None:
+        if len(_proxies) >= CACHE_SIZE:
+            _proxies.clear()
+        proxy = _proxies[prefix] = _decode_proxy(prefix)
+    return {'item': proxy, 'expire': EXPIRE.unpack(data[-4:])[0]}
@@ -1,17 +1,354 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from itertools import count as counter
+from time import time
+
+import msgpack
 import redis
 
 from proxypooler import config
 from proxypooler.errors import ProxyPoolerEmptyError
 
 
+# pop the first(or last if ARGV[2] == '1') ARGV[1] members with their scores,
+# zrange and zrem run in one script so the same member can never be popped twice.
+POP_SCRIPT = """
+local items
+if ARGV[2] == '1' then
+    items = redis.call('ZREVRANGE', KEYS[1], 0, ARGV[1] - 1, 'WITHSCORES')
+else
+    items = redis.call('ZRANGE', KEYS[1], 0, ARGV[1] - 1, 'WITHSCORES')
+end
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+end
+return items
+"""
+
+
+# pop at most ARGV[2] members whose score <= ARGV[1] with their scores.
+DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+end
+return items
+"""
+
+
+# remove members in ARGV[2..] whose score <= ARGV[1], return {removed, not due},
+# both like [member1, score1, ...], members not in pool were ignored.
+CLAIM_SCRIPT = """
+local claimed, later = {}, {}
+for i = 2, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score then
+        if tonumber(score) <= tonumber(ARGV[1]) then
+            redis.call('ZREM', KEYS[1], ARGV[i])
+            claimed[#claimed + 1] = ARGV[i]
+            claimed[#claimed + 1] = score
+        else
+            later[#later + 1] = ARGV[i]
+            later[#later + 1] = score
+        end
+    end
+end
+return {claimed, later}
+"""
+
+
+# read ARGV[1] members with scores from the last ARGV[3](0 for all) members, starting
+# at the ARGV[2]th from the last and wrapping around, nothing was removed.
+PEEK_SCRIPT = """
+local size = redis.call('ZCARD', KEYS[1])
+local window = tonumber(ARGV[3])
+if window <= 0 or window > size then
+    window = size
+end
+local count = math.min(tonumber(ARGV[1]), window)
+if count <= 0 then
+    return {}
+end
+local start = tonumber(ARGV[2]) % window
+local items = redis.call('ZREVRANGE', KEYS[1], start, math.min(start + count, window) - 1, 'WITHSCORES')
+if start + count > window then
+    local more = redis.call('ZREVRANGE', KEYS[1], 0, start + count - window - 1, 'WITHSCORES')
+    for i = 1, #more do
+        items[#items + 1] = more[i]
+    end
+end
+return items
+"""
+
+
+# KEYS: pool, leases(member -> lease deadline), leased(member -> score in pool).
+# lease the last ARGV[1] members until ARGV[2].
+LEASE_SCRIPT = """
+local items = redis.call('ZREVRANGE', KEYS[1], 0, ARGV[1] - 1, 'WITHSCORES')
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+    redis.call('ZADD', KEYS[2], ARGV[2], items[i])
+    redis.call('HSET', KEYS[3], items[i], items[i + 1])
+end
+return items
+"""
+
+RESTORE_LUA = """
+local function restore(member, items)
+    if redis.call('ZREM', KEYS[2], member) == 1 then
+        local score = redis.call('HGET', KEYS[3], member)
+        redis.call('HDEL', KEYS[3], member)
+        if score then
+            redis.call('ZADD', KEYS[1], score, member)
+            items[#items + 1] = member
+            items[#items + 1] = score
+        end
+    end
+end
+local items = {}
+"""
+
+# put leased members in ARGV back to pool.
+RELEASE_SCRIPT = RESTORE_LUA + """
+for i = 1, #ARGV do
+    restore(ARGV[i], items)
+end
+return items
+"""
+
+# put members whose lease deadline <= ARGV[1] back to pool.
+RECLAIM_SCRIPT = RESTORE_LUA + """
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])) do
+    restore(member, items)
+end
+return items
+"""
+
+# replace members ARGV[1], ARGV[3], ... still in pool with ARGV[2], ARGV[4], ... keeping their scores.
+REPLACE_SCRIPT = """
+local n = 0
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('ZADD', KEYS[1], score, ARGV[i + 1])
+        n = n + 1
+    end
+end
+return n
+"""
+
+# KEYS: pool, ids(identity -> 'period member'), leased, stats.
+# put members ARGV[2], ARGV[6], ... with scores ARGV[3], ..., identities ARGV[4], ... and
+# periods ARGV[5], ..., keeping one member for an identity by policy ARGV[1]:
+# 'earliest'(due), 'shortest'(period) or 'latest'(put). Return the number of duplicates.
+PUT_UNIQUE_SCRIPT = """
+local policy = ARGV[1]
+local duplicates = 0
+for i = 2, #ARGV, 4 do
+    local member, score, id, period = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2], ARGV[i + 3]
+    local put = true
+    local value = redis.call('HGET', KEYS[2], id)
+    if value then
+        local sep = string.find(value, ' ', 1, true)
+        local old = string.sub(value, sep + 1)
+        local old_score = redis.call('ZSCORE', KEYS[1], old)
+        if old_score then
+            duplicates = duplicates + 1
+            old_score = tonumber(old_score)
+            if policy == 'earliest' then
+                put = score < old_score
+            elseif policy == 'shortest' then
+                local old_period = tonumber(string.sub(value, 1, sep - 1))
+                put = tonumber(period) < old_period or
+                      (tonumber(period) == old_period and score < old_score)
+            end
+            if put and old ~= member then
+                redis.call('ZREM', KEYS[1], old)
+            end
+        elseif redis.call('HEXISTS', KEYS[3], old) == 1 then -- leased, put back later
+            duplicates = duplicates + 1
+            put = false
+        end
+    end
+    if put then
+        redis.call('ZADD', KEYS[1], score, member)
+        redis.call('HSET', KEYS[2], id, period .. ' ' .. member)
+    end
+end
+if duplicates > 0 then
+    redis.call('HINCRBY', KEYS[4], 'duplicates', duplicates)
+end
+return duplicates
+"""
+
+# forget identities ARGV[1], ... whose members were neither in pool nor leased.
+PRUNE_SCRIPT = """
+local n = 0
+for _, id in ipairs(ARGV) do
+    local value = redis.call('HGET', KEYS[2], id)
+    if value then
+        local old = string.sub(value, string.find(value, ' ', 1, true) + 1)
+        if not redis.call('ZSCORE', KEYS[1], old) and redis.call('HEXISTS', KEYS[3], old) == 0 then
+            redis.call('HDEL', KEYS[2], id)
+            n = n + 1
+        end
+    end
+end
+return n
+"""
+
+# KEYS: fast(proxy -> latency / success rate of proxies passed last time),
+# health(proxy -> 'latency rate checked_at'). ARGV[1] weight of a new result, ARGV[2] now,
+# then proxies ARGV[3], ARGV[5], ... with seconds they took ARGV[4], ..., -1 if failed.
+# latency and success rate were rolled by exponential moving average. Return success rates
+# as strings, '' for unknown proxies.
+RECORD_SCRIPT = """
+local alpha, now = tonumber(ARGV[1]), ARGV[2]
+local rates = {}
+for i = 3, #ARGV, 2 do
+    local proxy, latency = ARGV[i], tonumber(ARGV[i + 1])
+    local passed = latency >= 0
+    local value = redis.call('HGET', KEYS[2], proxy)
+    if value or passed then
+        local rate = 1
+        if value then
+            local sep = string.find(value, ' ', 1, true)
+            local sep2 = string.find(value, ' ', sep + 1, true)
+            local last = tonumber(string.sub(value, 1, sep - 1))
+            rate = tonumber(string.sub(value, sep + 1, sep2 - 1))
+            if passed then
+                latency = last + alpha * (latency - last)
+                rate = rate + alpha * (1 - rate)
+            else
+                latency = last
+                rate = rate * (1 - alpha)
+            end
+        end
+        redis.call('HSET', KEYS[2], proxy, latency .. ' ' .. rate .. ' ' .. now)
+        if passed then
+            redis.call('ZADD', KEYS[1], latency / rate, proxy)
+        else
+            redis.call('ZREM', KEYS[1], proxy)
+        end
+        rates[#rates + 1] = tostring(rate)
+    else
+        rates[#rates + 1] = ''
+    end
+end
+return rates
+"""
+
+# forget proxies ARGV[2], ... not checked since ARGV[1].
+PRUNE_HEALTH_SCRIPT = """
+local n = 0
+for i = 2, #ARGV do
+    local value = redis.call('HGET', KEYS[2], ARGV[i])
+    if value and tonumber(string.sub(value, string.find(value, ' [^ ]*$') + 1)) < tonumber(ARGV[1]) then
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        n = n + 1
+    end
+end
+return n
+"""
+
+# mark proxies ARGV[4], ... failed at ARGV[1] in KEYS[1](proxy -> failed at), forget
+# the ones failed before ARGV[2] and the earliest failed ones beyond ARGV[3] proxies.
+MARK_DEAD_SCRIPT = """
+for i = 4, #ARGV do
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[2])
+local extra = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[3])
+if extra > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, extra - 1)
+end
+return 0
+"""
+
+
+def lease_keys(name):
+    return [name, '{}:leases'.format(name), '{}:leased'.format(name)]
+
+
+def unique_keys(name):
+    return [name, '{}:ids'.format(name), '{}:leased'.format(name), '{}:stats'.format(name)]
+
+
+RESULTS = ('passed', 'failed', 'unreachable') # validate results counted in 'name:stats'
+
+
+def unique_args(items, ids, policy):
+    args = [policy]
+    for (item, expire), (id_, period) in zip(items, ids):
+        args.extend((item, expire, id_, period))
+    return args
+
+
+def health_keys(name):
+    return ['{}:fast'.format(name), '{}:health'.format(name)]
+
+
+def dead_key(name):
+    return '{}:dead'.format(name)
+
+
+def record_args(results, alpha, now):
+    args = [alpha, now]
+    for proxy, latency in results:
+        args.extend((proxy, -1 if latency is None else latency))
+    return args
+
+
+def parse_rates(rates):
+    return [float(rate) if rate else None for rate in rates]
+
+
+def rolled(health, latency, alpha):
+    """(latency, success rate) rolled from health (latency, rate) or None, None if unknown."""
+    if health is None:
+        return None if latency is None else (latency, 1)
+    last, rate = health
+    if latency is None:
+        return last, rate * (1 - alpha)
+    return last + alpha * (latency - last), rate + alpha * (1 - rate)
+
+
+def pair_scores(items):
+    """Turn [member1, score1, member2, score2, ...] into [(member1, score1), ...]."""
+    return [(item, float(expire)) for item, expire in zip(items[::2], items[1::2])]
+
+
 class RedisClient:
     """Underlying storage unit.
     
     Save Item object and its expire time in redis.
     """
 
-    def __init__(self, host=config.redis_host, port=config.redis_port):
+    def __init__(self, host=config.redis_host, port=config.redis_port,
+                 chunk_size=config.put_chunk_size, name=config.pool_name):
         self._db = redis.Redis(host=host, port=port)
+        self.name = name # key of the sorted set
+        self.chunk_size = chunk_size # max members in one zadd
+        self._pop = self._db.register_script(POP_SCRIPT)
+        self._due = self._db.register_script(DUE_SCRIPT)
+        self._claim = self._db.register_script(CLAIM_SCRIPT)
+        self._peek = self._db.register_script(PEEK_SCRIPT)
+        self._lease = self._db.register_script(LEASE_SCRIPT)
+        self._release = self._db.register_script(RELEASE_SCRIPT)
+        self._reclaim = self._db.register_script(RECLAIM_SCRIPT)
+        self._replace = self._db.register_script(REPLACE_SCRIPT)
+        self._put_unique = self._db.register_script(PUT_UNIQUE_SCRIPT)
+        self._prune = self._db.register_script(PRUNE_SCRIPT)
+        self._record = self._db.register_script(RECORD_SCRIPT)
+        self._prune_health = self._db.register_script(PRUNE_HEALTH_SCRIPT)
+        self._mark_dead = self._db.register_script(MARK_DEAD_SCRIPT)
 
     def get(self):
         """Get single item from pool.
@@ -23,19 +360,18 @@ class RedisClient:
             ProxyPoolEmptyError.
         """
         try:
-            # timeout return None, otherwise return bytes data
-            item = self._db.zrange(config.pool_name, 0, 0)[0]
-            expire = self._db.zscore(config.pool_name, item) # float
-            self._db.zrem(config.pool_name, item)
-            return item, expire
+            return self.get_list(1)[0]
         except IndexError:
             raise ProxyPoolerEmptyError('proxypooler was empty') from None
 
     def get_list(self, count=1, rev=False):
         """Get item list from pool.
 
+        Items were popped atomically in one round trip whatever the count is.
+
         Args:
-            the length of item list.
+            count: the length of item list.
+            rev: pop from the last(the latest validated) items.
 
         Returns:
             (item, expire) list, like: [(item1, expire1), ..., (itemN, expireN)].
@@ -43,22 +379,991 @@ class RedisClient:
         if count <= 0:
             return []
 
-        if not rev:
-            items = self._db.zrange(config.pool_name, 0, count - 1)
-        else:
-            items = self._db.zrevrange(config.pool_name, 0, count - 1) # the last
-        items_expires = [(item, self._db.zscore(config.pool_name, item)) for item in items]
+        items = self._pop(keys=[self.name], args=[count, int(rev)])
+        return pair_scores(items)
+
+    def peek_list(self, count=1, offset=0, window=0):
+        """Read item list from the last without removing them.
+
+        Args:
+            count: the length of item list.
+            offset: start at the offset-th from the last, wrap around the window.
+            window: only the last window items were read, 0 for all.
+
+        Returns:
+            (item, expire) list like get_list with rev.
+        """
+        if count <= 0:
+            return []
+
+        items = self._peek(keys=[self.name], args=[count, offset, window])
+        return pair_scores(items)
+
+    def head_list(self, count=1, rev=False):
+        """Read the items get_list(count, rev) would pop, without removing them."""
+        if count <= 0:
+            return []
+        if rev:
+            return self._db.zrevrange(self.name, 0, count - 1, withscores=True)
+        return self._db.zrange(self.name, 0, count - 1, withscores=True)
+
+    def peek_newer(self, expire, count):
+        """Read at most count items whose expire > expire from the last, without removing them."""
+        return self._db.zrevrangebyscore(self.name, '+inf', '({}'.format(expire),
+                                         start=0, num=count, withscores=True)
+
+    def get_due(self, now, count):
+        """Pop at most count items whose expire <= now, in order of expire.
+
+        Nothing was written if no item was due.
+        """
+        items = self._due(keys=[self.name], args=[now, count])
+        return pair_scores(items)
+
+    def next_due(self):
+        """The earliest expire in pool, None if pool was empty."""
+        items = self._db.zrange(self.name, 0, 0, withscores=True)
+        return items[0][1] if items else None
+
+    def claim(self, items, now):
+        """Pop the given items if they were due.
+
+        Args:
+            items: [item1, ..., itemN].
+            now: items whose expire <= now were due.
+
+        Returns:
+            ([(item, expire), ...] popped, [(item, expire), ...] not due yet).
+            Items not in pool were in neither.
+        """
+        if not items:
+            return [], []
+        claimed, later = self._claim(keys=[self.name], args=[now] + list(items))
+        return pair_scores(claimed), pair_scores(later)
+
+    def lease_list(self, count, deadline):
+        """Pop the last count items and keep them leased until deadline.
+
+        Returns:
+            (item, expire) list like get_list with rev.
+        """
+        if count <= 0:
+            return []
+        items = self._lease(keys=lease_keys(self.name), args=[count, deadline])
+        return pair_scores(items)
+
+    def release_list(self, items):
+        """Put leased items back to pool with their expire.
+
+        Returns:
+            [(item, expire), ...] put back, items not leased were ignored.
+        """
+        if not items:
+            return []
+        return pair_scores(self._release(keys=lease_keys(self.name), args=list(items)))
+
+    def reclaim(self, now):
+        """Put items whose lease deadline <= now back to pool, return them like release_list."""
+        return pair_scores(self._reclaim(keys=lease_keys(self.name), args=[now]))
+
+    def scan(self):
+        """Iterate all (item, expire) in pool without removing them."""
+        return self._db.zscan_iter(self.name, count=self.chunk_size)
+
+    def replace_list(self, pairs):
+        """Replace items like [(old, new), ...] keeping their expire, items not in pool were skipped.
+
+        Returns:
+            the number of replaced items.
+        """
+        if not pairs:
+            return 0
+        return self._replace(keys=[self.name], args=[x for pair in pairs for x in pair])
+
+    def put(self, item, expire):
+        self._db.zadd(self.name, item, expire) # name和score 与redis官方命令的顺序相反
+
+    def put_list(self, items):
+        """Put item list into pool.
+
+        Items were written by multi-member zadd in chunks of chunk_size,
+        all chunks were sent in one pipeline.
+
+        Args:
+            items: [(item1, expire1), ..., (itemN, expireN)].
+        """
+        if not items:
+            return
+
+        pipe = self._db.pipeline(transaction=False)
+        for start in range(0, len(items), self.chunk_size):
+            args = []
+            for item, expire in items[start:start + self.chunk_size]:
+                args.extend((item, expire))
+            pipe.zadd(self.name, *args)
+        pipe.execute()
+
+    def put_unique(self, items, ids, policy):
+        """Put items keeping one item for an identity.
+
+        Args:
+            items: [(item1, expire1), ..., (itemN, expireN)].
+            ids: [(identity1, period1), ..., (identityN, periodN)] of items.
+            policy: which item of the same identity was kept, 'earliest' expire,
+                    'shortest' period or 'latest' put.
+
+        Returns:
+            the number of items whose identity was already in pool.
+        """
+        duplicates = 0
+        for start in range(0, len(items), self.chunk_size):
+            end = start + self.chunk_size
+            duplicates += self._put_unique(keys=unique_keys(self.name),
+                                           args=unique_args(items[start:end], ids[start:end], policy))
+        return duplicates
+
+    def prune_ids(self):
+        """Forget identities of items got by others, return the number forgotten."""
+        pruned = 0
+        ids = []
+        for id_, _ in self._db.hscan_iter(unique_keys(self.name)[1], count=self.chunk_size):
+            ids.append(id_)
+            if len(ids) >= self.chunk_size:
+                pruned += self._prune(keys=unique_keys(self.name), args=ids)
+                ids = []
+        if ids:
+            pruned += self._prune(keys=unique_keys(self.name), args=ids)
+        return pruned
+
+    def stats(self):
+        duplicates = self._db.hget(unique_keys(self.name)[3], 'duplicates')
+        return {'size': self.size, 'duplicates': int(duplicates or 0)}
+
+    def count_validated(self, counts):
+        """Add counts of validate results like {'passed': n, ...} of celery validators."""
+        pipe = self._db.pipeline(transaction=False)
+        for result, n in counts.items():
+            if n:
+                pipe.hincrby(unique_keys(self.name)[3], result, n)
+        pipe.execute()
+
+    def validated(self):
+        """Counts of all validate results like {'passed': n, 'failed': n, 'unreachable': n}."""
+        counts = self._db.hmget(unique_keys(self.name)[3], RESULTS)
+        return {result: int(n or 0) for result, n in zip(RESULTS, counts)}
+
+    def record(self, results, now, alpha=config.latency_alpha):
+        """Record validate results into the index of fast proxies.
+
+        Args:
+            results: [(proxy1, latency1), ..., (proxyN, latencyN)], latency was seconds
+                     the validate request took, None if it failed.
+            now: time of the results, see prune_health.
+            alpha: weight of a new result in the rolling latency and success rate.
+
+        Returns:
+            [rate1, ..., rateN], success rates of proxies after recording, None if unknown.
+        """
+        rates = []
+        for start in range(0, len(results), self.chunk_size):
+            rates.extend(self._record(keys=health_keys(self.name),
+                                      args=record_args(results[start:start + self.chunk_size],
+                                                       alpha, now)))
+        return parse_rates(rates)
+
+    def fastest(self, count):
+        """[(proxy, latency / success rate), ...] of count fastest proxies passed last time."""
+        if count <= 0:
+            return []
+        return self._db.zrange(health_keys(self.name)[0], 0, count - 1, withscores=True)
+
+    def prune_health(self, before):
+        """Forget proxies not validated since before, return the number forgotten."""
+        pruned = 0
+        proxies = []
+        for proxy, _ in self._db.hscan_iter(health_keys(self.name)[1], count=self.chunk_size):
+            proxies.append(proxy)
+            if len(proxies) >= self.chunk_size:
+                pruned += self._prune_health(keys=health_keys(self.name), args=[before] + proxies)
+                proxies = []
+        if proxies:
+            pruned += self._prune_health(keys=health_keys(self.name), args=[before] + proxies)
+        return pruned
+
+    def mark_dead(self, proxies, now, ttl, size):
+        """Remember failed proxies for ttl seconds, size proxies at most.
+
+        Args:
+            proxies: [proxy1, ..., proxyN] failed at now.
+            ttl: seconds to remember a failed proxy.
+            size: max proxies remembered, the earliest failed ones were forgotten first.
+        """
+        for start in range(0, max(len(proxies), 1), self.chunk_size): # prune even if no proxies
+            self._mark_dead(keys=[dead_key(self.name)],
+                            args=[now, now - ttl, size] + list(proxies[start:start + self.chunk_size]))
+
+    def is_dead(self, proxies, since):
+        """[dead1, ..., deadN], whether proxies failed since then, see mark_dead."""
+        pipe = self._db.pipeline(transaction=False)
+        for proxy in proxies:
+            pipe.zscore(dead_key(self.name), proxy)
+        return [at is not None and at >= since for at in pipe.execute()]
+
+    @property
+    def size(self):
+        return self._db.zcard(self.name)
+
+
+class AsyncRedisClient:
+    """Asyncio version of RedisClient.
+
+    All methods(and "size") are coroutines, connection pool was created on first use.
+    """
+
+    def __init__(self, host=config.redis_host, port=config.redis_port,
+                 chunk_size=config.put_chunk_size, name=config.pool_name):
+        self.address = (host, port)
+        self.name = name
+        self.chunk_size = chunk_size
+        self._db = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        if self._db is None:
+            async with self._lock:
+                if self._db is None:
+                    import aioredis # only for saver 'async_redis', 1.x API
+                    self._db = await aioredis.create_redis_pool(self.address)
+        return self._db
+
+    async def get(self):
+        """Get single item from pool.
+
+        Returns:
+             (item, expire).
+
+        Raises:
+            ProxyPoolEmptyError.
+        """
+        try:
+            return (await self.get_list(1))[0]
+        except IndexError:
+            raise ProxyPoolerEmptyError('proxypooler was empty') from None
+
+    async def get_list(self, count=1, rev=False):
+        """Get item list from pool, the same as RedisClient.get_list."""
+        if count <= 0:
+            return []
+
+        db = await self._connect()
+        items = await db.eval(POP_SCRIPT, keys=[self.name], args=[count, int(rev)])
+        return pair_scores(items)
+
+    async def peek_list(self, count=1, offset=0, window=0):
+        """Read item list without removing them, the same as RedisClient.peek_list."""
+        if count <= 0:
+            return []
+
+        db = await self._connect()
+        items = await db.eval(PEEK_SCRIPT, keys=[self.name], args=[count, offset, window])
+        return pair_scores(items)
+
+    async def peek_newer(self, expire, count):
+        db = await self._connect()
+        return await db.zrevrangebyscore(self.name, min=expire, exclude=db.ZSET_EXCLUDE_MIN,
+                                         withscores=True, offset=0, count=count)
+
+    async def get_due(self, now, count):
+        """Pop due items, the same as RedisClient.get_due."""
+        db = await self._connect()
+        items = await db.eval(DUE_SCRIPT, keys=[self.name], args=[now, count])
+        return pair_scores(items)
+
+    async def next_due(self):
+        db = await self._connect()
+        items = await db.zrange(self.name, 0, 0, withscores=True)
+        return items[0][1] if items else None
+
+    async def claim(self, items, now):
+        """Pop the given items if they were due, the same as RedisClient.claim."""
+        if not items:
+            return [], []
+        db = await self._connect()
+        claimed, later = await db.eval(CLAIM_SCRIPT, keys=[self.name],
+                                       args=[now] + list(items))
+        return pair_scores(claimed), pair_scores(later)
+
+    async def lease_list(self, count, deadline):
+        """Lease the last count items, the same as RedisClient.lease_list."""
+        if count <= 0:
+            return []
+        db = await self._connect()
+        items = await db.eval(LEASE_SCRIPT, keys=lease_keys(self.name), args=[count, deadline])
+        return pair_scores(items)
+
+    async def release_list(self, items):
+        if not items:
+            return []
+        db = await self._connect()
+        return pair_scores(await db.eval(RELEASE_SCRIPT, keys=lease_keys(self.name), args=list(items)))
+
+    async def reclaim(self, now):
+        db = await self._connect()
+        return pair_scores(await db.eval(RECLAIM_SCRIPT, keys=lease_keys(self.name), args=[now]))
+
+    async def scan(self):
+        """All (item, expire) in pool as a list."""
+        db = await self._connect()
+        items = []
+        cursor = 0
+        while 1:
+            cursor, chunk = await db.zscan(self.name, cursor, count=self.chunk_size)
+            items.extend(chunk)
+            if int(cursor) == 0:
+                break
+        return items
+
+    async def put(self, item, expire):
+        db = await self._connect()
+        await db.zadd(self.name, expire, item) # the same order as redis command
+
+    async def put_list(self, items):
+        """Put item list into pool, the same as RedisClient.put_list."""
+        if not items:
+            return
+
+        db = await self._connect()
+        pipe = db.pipeline()
+        for start in range(0, len(items), self.chunk_size):
+            args = []
+            for item, expire in items[start:start + self.chunk_size]:
+                args.extend((expire, item))
+            pipe.zadd(self.name, *args)
+        await pipe.execute()
+
+    async def put_unique(self, items, ids, policy):
+        """Put items keeping one item for an identity, the same as RedisClient.put_unique."""
+        db = await self._connect()
+        duplicates = 0
+        for start in range(0, len(items), self.chunk_size):
+            end = start + self.chunk_size
+            duplicates += await db.eval(PUT_UNIQUE_SCRIPT, keys=unique_keys(self.name),
+                                        args=unique_args(items[start:end], ids[start:end], policy))
+        return duplicates
+
+    async def prune_ids(self):
+        db = await self._connect()
+        pruned = 0
+        cursor = 0
+        while 1:
+            cursor, ids = await db.hscan(unique_keys(self.name)[1], cursor, count=self.chunk_size)
+            if ids:
+                pruned += await db.eval(PRUNE_SCRIPT, keys=unique_keys(self.name),
+                                        args=[id_ for id_, _ in ids])
+            if int(cursor) == 0:
+                break
+        return pruned
+
+    async def stats(self):
+        db = await self._connect()
+        duplicates = await db.hget(unique_keys(self.name)[3], 'duplicates')
+        return {'size': await self.size(), 'duplicates': int(duplicates or 0)}
+
+    async def validated(self):
+        db = await self._connect()
+        counts = await db.hmget(unique_keys(self.name)[3], *RESULTS)
+        return {result: int(n or 0) for result, n in zip(RESULTS, counts)}
+
+    async def record(self, results, now, alpha=config.latency_alpha):
+        db = await self._connect()
+        rates = []
+        for start in range(0, len(results), self.chunk_size):
+            rates.extend(await db.eval(RECORD_SCRIPT, keys=health_keys(self.name),
+                                       args=record_args(results[start:start + self.chunk_size],
+                                                        alpha, now)))
+        return parse_rates(rates)
+
+    async def fastest(self, count):
+        if count <= 0:
+            return []
+        db = await self._connect()
+        return await db.zrange(health_keys(self.name)[0], 0, count - 1, withscores=True)
+
+    async def prune_health(self, before):
+        db = await self._connect()
+        pruned = 0
+        cursor = 0
+        while 1:
+            cursor, proxies = await db.hscan(health_keys(self.name)[1], cursor, count=self.chunk_size)
+            if proxies:
+                pruned += await db.eval(PRUNE_HEALTH_SCRIPT, keys=health_keys(self.name),
+                                        args=[before] + [proxy for proxy, _ in proxies])
+            if int(cursor) == 0:
+                break
+        return pruned
+
+    async def mark_dead(self, proxies, now, ttl, size):
+        db = await self._connect()
+        for start in range(0, max(len(proxies), 1), self.chunk_size): # prune even if no proxies
+            await db.eval(MARK_DEAD_SCRIPT, keys=[dead_key(self.name)],
+                          args=[now, now - ttl, size] + list(proxies[start:start + self.chunk_size]))
+
+    async def is_dead(self, proxies, since):
+        db = await self._connect()
+        pipe = db.pipeline()
+        for proxy in proxies:
+            pipe.zscore(dead_key(self.name), proxy)
+        return [at is not None and at >= since for at in await pipe.execute()]
+
+    async def size(self):
+        db = await self._connect()
+        return await db.zcard(self.name)
+
+
+
+class MemorySaver:
+    """In-process storage unit.
+
+    Items were kept in a min heap and a max heap of (expire, seq, item), and an index of
+    item -> (expire, seq). Heap entries not matching the index were stale(popped from the
+    other heap or overwritten by later put) and were dropped lazily, so get, put and get
+    from the last were all O(log n). Items with the same expire were popped in insertion
+    order from both ends.
+
+    Args:
+        snapshot: file to load items from on start and to dump items into, None to disable.
+        snapshot_interval: seconds between two snapshots, checked after each put or get.
+    """
+
+    def __init__(self, snapshot=None, snapshot_interval=60):
+        self._index = {}
+        self._leases = {} # item -> (deadline, expire)
+        self._ids = {} # identity -> (period, item)
+        self._health = {} # proxy -> (latency, success rate, checked at)
+        self._fast = {} # proxy -> latency / success rate of proxies passed last time
+        self._dead = OrderedDict() # proxy -> failed at, the earliest failed first
+        self.duplicates = 0
+        self._min = []
+        self._max = []
+        self._seq = counter()
+        self._lock = threading.Lock()
+        self.snapshot_path = snapshot
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_at = time()
+        self._snapshot_lock = threading.Lock() # one dump into '<snapshot>.tmp' at a time
+        if snapshot and os.path.exists(snapshot):
+            self._load()
+
+    def _push(self, item, expire):
+        seq = next(self._seq)
+        self._index[item] = (expire, seq)
+        heapq.heappush(self._min, (expire, seq, item))
+        heapq.heappush(self._max, (-expire, -seq, item))
+
+    def _pop(self, rev):
+        heap = self._max if rev else self._min
+        while heap:
+            expire, seq, item = heapq.heappop(heap)
+            if rev:
+                expire, seq = -expire, -seq
+            if self._index.get(item) == (expire, seq):
+                del self._index[item]
+                return item, expire
+        raise ProxyPoolerEmptyError('proxypooler was empty')
+
+    def _head(self):
+        """Drop stale entries on the top of min heap, return the live top or None."""
+        while self._min:
+            expire, seq, item = self._min[0]
+            if self._index.get(item) == (expire, seq):
+                return self._min[0]
+            heapq.heappop(self._min)
+        return None
+
+    def _compact(self):
+        """Rebuild heaps when most of the entries were stale."""
+        if len(self._min) + len(self._max) > 4 * len(self._index) + 1024:
+            self._min = [(expire, seq, item) for item, (expire, seq) in self._index.items()]
+            self._max = [(-expire, -seq, item) for expire, seq, item in self._min]
+            heapq.heapify(self._min)
+            heapq.heapify(self._max)
+
+    def get(self, rev=False):
+        """Get single item from pool.
+
+        Returns:
+             (item, expire).
+
+        Raises:
+            ProxyPoolEmptyError.
+        """
+        with self._lock:
+            item = self._pop(rev)
+            self._compact()
+        self._maybe_snapshot()
+        return item
+
+    def get_list(self, count=1, rev=False):
+        """Get item list from pool, the same as RedisClient.get_list."""
+        items = []
+        with self._lock:
+            for _ in range(count):
+                try:
+                    items.append(self._pop(rev))
+                except ProxyPoolerEmptyError:
+                    break
+            self._compact()
+        self._maybe_snapshot()
+        return items
+
+    def peek_list(self, count=1, offset=0, window=0):
+        """Read item list without removing them, the same as RedisClient.peek_list.
+
+        It was O(n log window), not for large pool.
+        """
+        with self._lock:
+            size = len(self._index)
+            if window <= 0 or window > size:
+                window = size
+            count = min(count, window)
+            if count <= 0:
+                return []
+            last = heapq.nlargest(window, ((expire, seq, item)
+                                           for item, (expire, seq) in self._index.items()))
+        start = offset % window
+        items = last[start:start + count] + last[:max(start + count - window, 0)]
+        return [(item, expire) for expire, _, item in items]
+
+    def peek_newer(self, expire, count):
+        with self._lock:
+            items = heapq.nlargest(count, ((expire_, seq, item)
+                                           for item, (expire_, seq) in self._index.items()
+                                           if expire_ > expire))
+        return [(item, expire_) for expire_, _, item in items]
+
+    def get_due(self, now, count):
+        """Pop due items, the same as RedisClient.get_due."""
+        items = []
+        with self._lock:
+            while len(items) < count:
+                head = self._head()
+                if head is None or head[0] > now:
+                    break
+                items.append(self._pop(False))
+            self._compact()
         if items:
-            self._db.zrem(config.pool_name, *items)
-        return items_expires
+            self._maybe_snapshot()
+        return items
+
+    def next_due(self):
+        with self._lock:
+            head = self._head()
+        return head[0] if head is not None else None
+
+    def claim(self, items, now):
+        """Pop the given items if they were due, the same as RedisClient.claim."""
+        claimed, later = [], []
+        with self._lock:
+            for item in items:
+                if item not in self._index:
+                    continue
+                expire, _ = self._index[item]
+                if expire <= now:
+                    del self._index[item] # heap entries become stale
+                    claimed.append((item, expire))
+                else:
+                    later.append((item, expire))
+            self._compact()
+        if claimed:
+            self._maybe_snapshot()
+        return claimed, later
+
+    def lease_list(self, count, deadline):
+        """Lease the last count items, the same as RedisClient.lease_list."""
+        items = []
+        with self._lock:
+            for _ in range(count):
+                try:
+                    item, expire = self._pop(True)
+                except ProxyPoolerEmptyError:
+                    break
+                self._leases[item] = (deadline, expire)
+                items.append((item, expire))
+        return items
+
+    def _restore(self, items):
+        restored = []
+        for item in items:
+            _, expire = self._leases.pop(item)
+            self._push(item, expire)
+            restored.append((item, expire))
+        return restored
+
+    def release_list(self, items):
+        with self._lock:
+            return self._restore([item for item in items if item in self._leases])
+
+    def reclaim(self, now):
+        """Put items whose lease deadline <= now back, it was O(number of leases)."""
+        with self._lock:
+            return self._restore([item for item, (deadline, _) in self._leases.items()
+                                  if deadline <= now])
+
+    def scan(self):
+        with self._lock:
+            return [(item, expire) for item, (expire, _) in self._index.items()]
+
+    def replace_list(self, pairs):
+        replaced = 0
+        with self._lock:
+            for old, new in pairs:
+                if old in self._index:
+                    expire, _ = self._index.pop(old)
+                    self._push(new, expire)
+                    replaced += 1
+            self._compact()
+        self._maybe_snapshot()
+        return replaced
+
+    def put(self, item, expire):
+        with self._lock:
+            self._push(item, expire)
+            self._compact()
+        self._maybe_snapshot()
+
+    def put_list(self, items):
+        with self._lock:
+            for item, expire in items:
+                self._push(item, expire)
+            self._compact()
+        self._maybe_snapshot()
+
+    def put_unique(self, items, ids, policy):
+        """Put items keeping one item for an identity, the same as RedisClient.put_unique."""
+        duplicates = 0
+        with self._lock:
+            for (item, expire), (id_, period) in zip(items, ids):
+                put = True
+                if id_ in self._ids:
+                    old_period, old = self._ids[id_]
+                    if old in self._index:
+                        duplicates += 1
+                        old_expire, _ = self._index[old]
+                        if policy == 'earliest':
+                            put = expire < old_expire
+                        elif policy == 'shortest':
+                            put = (period, expire) < (old_period, old_expire)
+                        if put and old != item:
+                            del self._index[old] # heap entries become stale
+                    elif old in self._leases:
+                        duplicates += 1
+                        put = False
+                if put:
+                    self._push(item, expire)
+                    self._ids[id_] = (period, item)
+            self.duplicates += duplicates
+            self._compact()
+        self._maybe_snapshot()
+        return duplicates
+
+    def prune_ids(self):
+        with self._lock:
+            stale = [id_ for id_, (_, item) in self._ids.items()
+                     if item not in self._index and item not in self._leases]
+            for id_ in stale:
+                del self._ids[id_]
+        return len(stale)
+
+    def stats(self):
+        return {'size': self.size, 'duplicates': self.duplicates}
+
+    def record(self, results, now, alpha=config.latency_alpha):
+        """Record validate results, the same as RedisClient.record."""
+        rates = []
+        with self._lock:
+            for proxy, latency in results:
+                health = self._health.get(proxy)
+                health = rolled(health and health[:2], latency, alpha)
+                if health is None:
+                    rates.append(None)
+                    continue
+                self._health[proxy] = health + (now,)
+                if latency is None:
+                    self._fast.pop(proxy, None)
+                else:
+                    self._fast[proxy] = health[0] / health[1]
+                rates.append(health[1])
+        return rates
+
+    def fastest(self, count):
+        """The same as RedisClient.fastest, it was O(n log count)."""
+        with self._lock:
+            return heapq.nsmallest(count, self._fast.items(), key=lambda x: (x[1], x[0]))
+
+    def prune_health(self, before):
+        with self._lock:
+            stale = [proxy for proxy, (_, _, at) in self._health.items() if at < before]
+            for proxy in stale:
+                del self._health[proxy]
+                self._fast.pop(proxy, None)
+        return len(stale)
+
+    def mark_dead(self, proxies, now, ttl, size):
+        """Remember failed proxies, the same as RedisClient.mark_dead."""
+        with self._lock:
+            for proxy in proxies:
+                self._dead.pop(proxy, None)
+                self._dead[proxy] = now
+            while self._dead and (len(self._dead) > size or
+                                  next(iter(self._dead.values())) < now - ttl):
+                self._dead.popitem(last=False)
+
+    def is_dead(self, proxies, since):
+        with self._lock:
+            return [proxy in self._dead and self._dead[proxy] >= since for proxy in proxies]
+
+    @property
+    def size(self):
+        return len(self._index)
+
+    def _load(self):
+        with open(self.snapshot_path, 'rb') as f:
+            items = msgpack.unpackb(f.read(), use_list=False)
+        with self._lock:
+            for item, expire in items:
+                self._push(item, expire)
+
+    def snapshot(self):
+        """Dump all items(leased items included) into snapshot file."""
+        with self._snapshot_lock:
+            with self._lock:
+                self._snapshot_at = time()
+                items = [(item, expire) for item, (expire, _) in self._index.items()]
+                items.extend((item, expire) for item, (_, expire) in self._leases.items())
+            tmp = '{}.tmp'.format(self.snapshot_path)
+            with open(tmp, 'wb') as f:
+                f.write(msgpack.packb(items, use_bin_type=True))
+            os.replace(tmp, self.snapshot_path) # never leave a half written snapshot
+
+    def _maybe_snapshot(self):
+        """Snapshot if it was due, the thread claimed it first dumped, others went on."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            if time() - self._snapshot_at < self.snapshot_interval:
+                return
+            self._snapshot_at = time()
+        self.snapshot()
+
+
+
+class ShardedSaver:
+    """Pool spread over several savers like RedisClient by crc32 of proxy.
+
+    Shards could be sorted sets on one redis node or on several. To get items, the
+    heads of all shards were read and merged by expire, then every shard popped its
+    part atomically, so items were in the same order as one sorted set unless others
+    put or got items meanwhile.
+
+    Validators only looked for due items in the shards of 'validate'(indexes, None for
+    all) one shard at a time, so validators of different shards could run in parallel.
+    Items were still put into and got from all shards.
+
+    'identity' gave the proxy of an item, like ext.member_proxy, so all items of a proxy
+    with different periods, and its health and dead marks, were kept in one shard.
+    Items themselves were the proxies if it was None.
+    """
+
+    def __init__(self, shards, validate=None, identity=None):
+        self.shards = list(shards)
+        self.validate = [self.shards[i] for i in validate] if validate else self.shards
+        self.identity = identity
+        self._start = 0 # shard which get_due starts from
+
+    def shard_of(self, proxy):
+        key = proxy.encode('utf-8') if isinstance(proxy, str) else proxy
+        return self.shards[zlib.crc32(key) % len(self.shards)]
+
+    def shard(self, item):
+        return self.shard_of(self.identity(item) if self.identity else item)
+
+    def _group(self, items, key=None, shard=None):
+        """Group items like {shard: [item, ...]}, shard was chosen by shard(key(item))."""
+        shard = shard or self.shard
+        groups = {}
+        for x in items:
+            groups.setdefault(shard(key(x) if key else x), []).append(x)
+        return groups
+
+    @staticmethod
+    def _quotas(heads, count, rev):
+        """The number of items every shard gives for the first count items of all heads."""
+        quotas = [0] * len(heads)
+        first = heapq.nsmallest(count, ((-expire if rev else expire, i)
+                                        for i, head in enumerate(heads) for _, expire in head))
+        for _, i in first:
+            quotas[i] += 1
+        return quotas
+
+    def _take(self, count, rev, take):
+        """Merge the first count items of all shards taken by take(shard, n)."""
+        if count <= 0:
+            return []
+        heads = [shard.head_list(count, rev) for shard in self.shards]
+        items = []
+        for shard, quota in zip(self.shards, self._quotas(heads, count, rev)):
+            if quota:
+                items.extend(take(shard, quota))
+        items.sort(key=lambda x: (x[1], x[0]), reverse=rev) # the same order as one sorted set
+        return items
+
+    def get(self):
+        try:
+            return self.get_list(1)[0]
+        except IndexError:
+            raise ProxyPoolerEmptyError('proxypooler was empty') from None
+
+    def get_list(self, count=1, rev=False):
+        """Pop items like RedisClient.get_list across shards."""
+        return self._take(count, rev, lambda shard, n: shard.get_list(n, rev))
+
+    def head_list(self, count=1, rev=False):
+        return self._take(count, rev, lambda shard, n: shard.head_list(n, rev))
+
+    def peek_list(self, count=1, offset=0, window=0):
+        """Read items like RedisClient.peek_list across shards."""
+        size = self.size
+        window = min(window, size) if window else size
+        count = min(count, window)
+        if count <= 0:
+            return []
+        start = offset % window
+        last = self.head_list(min(start + count, window), rev=True)
+        return last[start:start + count] + last[:max(start + count - window, 0)]
+
+    def peek_newer(self, expire, count):
+        items = [item for shard in self.shards for item in shard.peek_newer(expire, count)]
+        return heapq.nlargest(count, items, key=lambda x: x[1])
+
+    def get_due(self, now, count):
+        """Pop due items from the validated shards, one shard at a time.
+
+        Shards were visited round-robin, so a shard full of due items could not
+        starve the others.
+        """
+        items = []
+        shards = self.validate
+        for n in range(len(shards)):
+            if len(items) >= count:
+                break
+            shard = shards[(self._start + n) % len(shards)]
+            items.extend(shard.get_due(now, count - len(items)))
+        self._start = (self._start + 1) % len(shards)
+        items.sort(key=lambda x: (x[1], x[0]))
+        return items
+
+    def next_due(self):
+        dues = [due for due in (shard.next_due() for shard in self.validate) if due is not None]
+        return min(dues) if dues else None
+
+    def claim(self, items, now):
+        claimed, later = [], []
+        for shard, group in self._group(items).items():
+            claimed_, later_ = shard.claim(group, now)
+            claimed.extend(claimed_)
+            later.extend(later_)
+        return claimed, later
+
+    def lease_list(self, count, deadline):
+        return self._take(count, True, lambda shard, n: shard.lease_list(n, deadline))
+
+    def release_list(self, items):
+        return [x for shard, group in self._group(items).items()
+                for x in shard.release_list(group)]
+
+    def reclaim(self, now):
+        return [x for shard in self.shards for x in shard.reclaim(now)]
+
+    def scan(self):
+        """Iterate all (item, expire) of the validated shards."""
+        return itertools.chain.from_iterable(shard.scan() for shard in self.validate)
+
+    def replace_list(self, pairs):
+        """Replace items like RedisClient.replace_list, moving them if their shard changed."""
+        replaced = 0
+        for shard, group in self._group(pairs, key=lambda pair: pair[0]).items():
+            moved = [(old, new) for old, new in group if self.shard(new) is not shard]
+            replaced += shard.replace_list([pair for pair in group
+                                            if self.shard(pair[1]) is shard])
+            if moved:
+                news = dict(moved)
+                claimed, _ = shard.claim(list(news), float('inf'))
+                self.put_list([(news[old], expire) for old, expire in claimed])
+                replaced += len(claimed)
+        return replaced
 
     def put(self, item, expire):
-        self._db.zadd(config.pool_name, item, expire) # name和score 与redis官方命令的顺序相反
+        self.shard(item).put(item, expire)
 
     def put_list(self, items):
-        for item, expire in items:
-            self.put(item, expire)
+        for shard, group in self._group(items, key=lambda x: x[0]).items():
+            shard.put_list(group)
+
+    def put_unique(self, items, ids, policy):
+        """Put items like RedisClient.put_unique, items of an identity were in one shard."""
+        groups = self._group(zip(items, ids), key=lambda x: x[0][0])
+        return sum(shard.put_unique([x for x, _ in group], [id_ for _, id_ in group], policy)
+                   for shard, group in groups.items())
+
+    def prune_ids(self):
+        return sum(shard.prune_ids() for shard in self.shards)
+
+    def stats(self):
+        stats = [shard.stats() for shard in self.shards]
+        return {'size': sum(x['size'] for x in stats),
+                'duplicates': sum(x['duplicates'] for x in stats)}
+
+    def count_validated(self, counts):
+        self.shards[0].count_validated(counts)
+
+    def validated(self):
+        counts = [shard.validated() for shard in self.shards]
+        return {result: sum(x[result] for x in counts) for result in RESULTS}
+
+    def record(self, results, now, alpha=config.latency_alpha):
+        rates = {}
+        for shard, group in self._group(results, key=lambda x: x[0], shard=self.shard_of).items():
+            rates.update(zip((proxy for proxy, _ in group), shard.record(group, now, alpha)))
+        return [rates[proxy] for proxy, _ in results]
+
+    def fastest(self, count):
+        return heapq.nsmallest(count, (x for shard in self.shards for x in shard.fastest(count)),
+                               key=lambda x: (x[1], x[0]))
+
+    def prune_health(self, before):
+        return sum(shard.prune_health(before) for shard in self.shards)
+
+    def mark_dead(self, proxies, now, ttl, size):
+        """Remember failed proxies in their shards, each shard remembers size / shards."""
+        for shard, group in self._group(proxies, shard=self.shard_of).items():
+            shard.mark_dead(group, now, ttl, -(-size // len(self.shards)))
+
+    def is_dead(self, proxies, since):
+        dead = {}
+        for shard, group in self._group(proxies, shard=self.shard_of).items():
+            dead.update(zip(group, shard.is_dead(group, since)))
+        return [dead[proxy] for proxy in proxies]
 
     @property
     def size(self):
-        return self._db.zcard(config.pool_name)
+        return sum(shard.size for shard in self.shards)
+
+
+def make_shards(count=config.shard_count, nodes=config.shard_nodes, name=config.pool_name):
+    """RedisClient of sorted sets 'name:0', 'name:1', ... on nodes like ['host:port', ...] in turn."""
+    nodes = nodes or ['{}:{}'.format(config.redis_host, config.redis_port)]
+    shards = []
+    for i in range(count):
+        host, _, port = nodes[i % len(nodes)].rpartition(':')
+        shards.append(RedisClient(host, int(port), name='{}:{}'.format(name, i)))
+    return shards
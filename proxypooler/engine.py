@@ -0,0 +1,177 @@
+import asyncio
+import threading
+from random import choice
+from time import time
+
+import aiohttp
+from async_timeout import timeout
+
+from proxypooler import config, metrics
+from proxypooler.ext import logger
+from proxypooler.period import get_policy, next_periods
+from proxypooler.probe import probe_async
+
+
+def proxy_url(proxy):
+    """aiohttp requires the scheme of proxy, add 'http://' if missing."""
+    if '://' in proxy:
+        return proxy
+    return 'http://{}'.format(proxy)
+
+
+class ValidateEngine:
+    """Validate proxies in an event loop instead of sending celery tasks.
+
+    Due items were queued by submit and validated by 'concurrency' worker coroutines
+    sharing one aiohttp session, each request was limited to 'timeout' seconds.
+    Passed proxies were put back directly with 'put_list', a coroutine function
+    like ProxyPooler.put_passed_async, config.validate_count items at a time or every
+    'flush' seconds, so there was no broker message, task or sender for a proxy.
+    Results were recorded with 'record' like ProxyPooler.record_async the same way,
+    None to skip, before passed proxies were put back with periods from 'policy',
+    see period.py. Failed proxies were passed to 'mark_dead' like
+    ProxyPooler.mark_dead_async, None to skip.
+
+    Every proxy was probed by TCP connect within 'probe_timeout' seconds first, see
+    probe.py, so dead proxies did not hold a worker for 'timeout' seconds.
+
+    At most 'concurrency' * 'backlog' items were queued, the validator popped no more
+    than room() due items from saver, so a backlog of due proxies stayed in saver
+    rather than in process memory where a restart lost them.
+
+    Attributes:
+        passed: the number of passed proxies.
+        failed: the number of expired proxies.
+        unreachable: the number of expired proxies failed the probe.
+    """
+
+    def __init__(self, put_list, concurrency=config.engine_concurrency,
+                 timeout=config.validate_timeout, flush=config.engine_flush, record=None,
+                 policy=None, mark_dead=None, probe_timeout=config.probe_timeout,
+                 backlog=config.engine_backlog):
+        self.put_list = put_list
+        self.record = record
+        self.mark_dead = mark_dead
+        self.policy = policy or get_policy()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.flush_interval = flush
+        self.probe_timeout = probe_timeout
+        self.backlog = backlog
+        self.loop = None
+        self.queue = None
+        self._pending = 0 # items submitted and not taken by workers yet
+        self._pending_lock = threading.Lock() # submit in validator thread, take in loop
+        self.session = None
+        self.passed = 0
+        self.failed = 0
+        self.unreachable = 0
+        self._passed = [] # [(proxy, expire), ...] to put back
+        self._results = [] # [(proxy, latency or None), ...] to record
+        self._failed = [] # proxies to mark dead
+
+    def start(self, loop):
+        """Start workers in 'loop', submit could be called from any thread after it."""
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=self.concurrency * self.backlog)
+        loop.create_task(self._run())
+
+    async def _run(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, force_close=True)
+        self.session = aiohttp.ClientSession(connector=connector)
+        await asyncio.gather(self._flusher(), *(self._worker() for _ in range(self.concurrency)))
+
+    def room(self):
+        """The number of items submit could take now."""
+        with self._pending_lock:
+            return max(self.concurrency * self.backlog - self._pending, 0)
+
+    def submit(self, items):
+        """Queue unpacked items like [{'item': proxy, 'expire': expire}, ...] to validate.
+
+        No more than room() items should be submitted.
+        """
+        with self._pending_lock:
+            self._pending += len(items)
+        self.loop.call_soon_threadsafe(self._enqueue, items)
+
+    def _enqueue(self, items):
+        for item in items:
+            self.queue.put_nowait(item)
+
+    async def probe(self, proxy):
+        return await probe_async(proxy, self.probe_timeout)
+
+    async def validate(self, proxy):
+        """Seconds validate_url took to be fetched through proxy, None if it failed."""
+        headers = dict(config.headers.dict())
+        headers['User-Agent'] = choice(config.user_agent)
+        headers['Pragma'] = 'no-cache'
+        started = self.loop.time()
+        try:
+            with timeout(self.timeout):
+                async with self.session.get(config.validate_url, headers=headers,
+                                            proxy=proxy_url(proxy)) as response:
+                    if response.status == 200:
+                        return self.loop.time() - started
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        return None
+
+    async def _worker(self):
+        while 1:
+            item = await self.queue.get()
+            with self._pending_lock:
+                self._pending -= 1
+            proxy, expire = item['item'], item['expire']
+            try:
+                reachable = await self.probe(proxy)
+                latency = await self.validate(proxy) if reachable else None
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc: # keep the worker alive, the proxy failed
+                logger.error('engine failed to validate {}: {!r}'.format(proxy, exc))
+                reachable, latency = True, None
+            if not reachable:
+                self.unreachable += 1
+            if self.record is not None:
+                self._results.append((proxy, latency))
+            if latency is not None:
+                self.passed += 1
+                self._passed.append((proxy, expire))
+                metrics.validated.inc(result='passed')
+            else:
+                self.failed += 1
+                metrics.validated.inc(result='failed' if reachable else 'unreachable')
+                if self.mark_dead is not None:
+                    self._failed.append(proxy)
+            if max(len(self._passed), len(self._results), len(self._failed)) >= config.validate_count:
+                await self.flush()
+
+    async def flush(self):
+        """Record results, put passed proxies back and mark failed ones dead."""
+        results, self._results = self._results, []
+        rates = {}
+        if results:
+            try:
+                rates = dict(zip((proxy for proxy, _ in results), await self.record(results, time())))
+            except Exception as exc:
+                logger.warning('engine failed to record {} results: {!r}'.format(len(results), exc))
+        items, self._passed = self._passed, []
+        if items:
+            items = next_periods(self.policy, items, [rates.get(proxy) for proxy, _ in items])
+            try:
+                await self.put_list(items)
+            except Exception as exc:
+                logger.error('engine failed to put back {} proxies: {!r}'.format(len(items), exc))
+        failed, self._failed = self._failed, []
+        if failed:
+            try:
+                await self.mark_dead(failed)
+            except Exception as exc:
+                logger.warning('engine failed to mark {} proxies dead: {!r}'.format(len(failed), exc))
+
+    async def _flusher(self):
+        while 1:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
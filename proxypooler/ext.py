@@ -2,19 +2,48 @@ from functools import partial
 
 import msgpack
 
-from proxypooler import config
-from proxypooler.task_logger import log
-from proxypooler.utils import LoggerAsync, MQueue
-from proxypooler.db import RedisClient
+from proxypooler import codec, config
+from proxypooler.task_logger import log, write
+from proxypooler.utils import LogBuffer, LoggerAsync, LoggerBuffered, MQueue
+from proxypooler.db import AsyncRedisClient, RedisClient
 
 
 conn = RedisClient()
+aconn = AsyncRedisClient()
 
 serial = msgpack.packb # use MessagePack as serializer
 deserial = partial(msgpack.unpackb, encoding='utf-8', use_list=False)
 
-logger = LoggerAsync(config.project, log)
-server_logger = LoggerAsync(config.project_srv, log)
+
+def compact_serial(item):
+    """Serialize packed item with codec, MessagePack if it was not compact."""
+    return codec.encode(item) or serial(item)
+
+def member_deserial(data):
+    """Deserialize packed item in saver, compact or MessagePack."""
+    if codec.is_compact(data):
+        return codec.decode(data)
+    return deserial(data)
+
+def member_identity(data):
+    """(proxy, validate period) of a serialized packed item, compact or MessagePack."""
+    item = member_deserial(data)
+    return item['item'], item['expire']
+
+def member_proxy(data):
+    """Proxy of a serialized packed item, ShardedSaver kept items of a proxy in one shard by it."""
+    return member_deserial(data)['item']
+
+# serializer of packed items in saver, config.codec 'compact' or 'msgpack'
+member_serial = compact_serial if config.codec == 'compact' else serial
+
+if config.log_backend == 'celery':
+    logger = LoggerAsync(config.project, log)
+    server_logger = LoggerAsync(config.project_srv, log)
+else:
+    log_buffer = LogBuffer(write)
+    logger = LoggerBuffered(config.project, log_buffer)
+    server_logger = LoggerBuffered(config.project_srv, log_buffer)
 
 validator_pub_queue = MQueue('pub', config.mq_url,
                              'proxypooler_validator_exchange', 'proxypooler_validator_queue')
@@ -0,0 +1,151 @@
+"""Metrics of a process exposed in Prometheus text format.
+
+Metrics were module level objects registered in REGISTRY, updated from any thread
+and rendered by render() for the '/metrics' route of the server, or of the
+validator if it ran without server, see ProxyPooler.start_metrics.
+
+Pass and fail counts of celery validators were not in validator processes, they were
+counted in saver and exported as proxypooler_celery_validated_total, see
+task_validator.count.
+"""
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+REGISTRY = []
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs))
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Values of a metric keyed by label values, labels were passed as keywords."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, doc, labels=(), registry=REGISTRY):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._values = {} # label values -> value
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        """[(suffix, [(label, value), ...], value), ...] to render."""
+        with self._lock:
+            values = sorted(self._values.items())
+        return [('', list(zip(self.labelnames, key)), value) for key, value in values]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.doc),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, labels, value in self._samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, _labels(labels), _number(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class SharedCounter(Gauge):
+    """Counter kept outside the process, such as in saver, set from there when rendered."""
+
+    kind = 'counter'
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets of upper bounds 'buckets'."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=BUCKETS, registry=REGISTRY):
+        super().__init__(name, doc, labels, registry)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe seconds the block took."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            count = 0
+            for bound, n in zip(self.buckets, counts):
+                count += n
+                samples.append(('_bucket', labels + [('le', _number(float(bound)))], count))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+
+def render(registry=REGISTRY):
+    """All metrics in Prometheus text format."""
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+pool_size = Gauge('proxypooler_pool_size', 'Proxies in pool.')
+websockets = Gauge('proxypooler_websockets', 'Open websocket connections of the server.')
+ingested = Counter('proxypooler_ingested_total', 'Proxies received through websocket.', ['source'])
+served = Counter('proxypooler_served_total', 'Proxies sent to clients.', ['cmd'])
+rejected = Counter('proxypooler_rejected_total', 'Proxies dropped on put for they failed recently.')
+command_seconds = Histogram('proxypooler_command_seconds', 'Seconds to answer websocket commands.',
+                            ['cmd'])
+saver_seconds = Histogram('proxypooler_saver_seconds', 'Seconds of saver calls.', ['op'])
+dispatched = Counter('proxypooler_dispatched_total', 'Due proxies sent to validate.')
+validated = Counter('proxypooler_validated_total',
+                    "Proxies validated by the engine, result 'passed', 'failed' or 'unreachable'.",
+                    ['result'])
+celery_validated = SharedCounter('proxypooler_celery_validated_total',
+                                 'Proxies validated by celery validators, counted in saver.',
+                                 ['result'])
@@ -1,6 +1,7 @@
 from time import time
 
-from proxypooler.ext import conn, serial, deserial
+from proxypooler import config, metrics
+from proxypooler.ext import aconn, conn, member_deserial, member_identity, member_serial
 
 
 def pack(item, expire=None):
@@ -31,9 +32,9 @@ def serialize(item, expire):
          expire: None or expire as validate period.
     """
     if isinstance(item, list):
-        item = [(serial(item_), expire_) for item_, expire_ in item]
+        item = [(member_serial(item_), expire_) for item_, expire_ in item]
     else:
-        item = serial(item)
+        item = member_serial(item)
 
     return item, expire
 
@@ -45,9 +46,9 @@ def deserialize(item, expire):
          expire: None or expire as validate period.
     """
     if isinstance(item, list):
-        item = [(deserial(item_), expire_) for item_, expire_ in item]
+        item = [(member_deserial(item_), expire_) for item_, expire_ in item]
     else:
-        item = deserial(item)
+        item = member_deserial(item)
 
     return item, expire
 
@@ -65,25 +66,127 @@ def update_expire(item, expire):
 
     return item, expire
 
-def put_in(item, expire, saver=conn):
+def _notify(item, expire, scheduler):
+    if scheduler is None:
+        return
+    if isinstance(item, list):
+        scheduler.notify(item)
+    else:
+        scheduler.notify([(item, expire)])
+
+def put_in(item, expire, saver=conn, scheduler=None):
     """Save item.
 
      Args:
          item: [(serialized, expire), ...] or serialized.
          expire: None or expire as next validate time.
          saver: container to persistent save item according to the order of the expire.
+         scheduler: validator's scheduler to notify after saved, None to skip.
     """
-    if isinstance(item, list):
-        if hasattr(saver, 'put_list'):
-            saver.put_list(item)
+    with metrics.saver_seconds.time(op='put'):
+        if config.dedupe != 'off' and hasattr(saver, 'put_unique'):
+            items = item if isinstance(item, list) else [(item, expire)]
+            saver.put_unique(items, [member_identity(x) for x, _ in items], config.dedupe)
+        elif isinstance(item, list):
+            if hasattr(saver, 'put_list'):
+                saver.put_list(item)
+            else:
+                for x in item:
+                    saver.put(*x)
         else:
-            for x in item:
-                saver.put(*x)
-    else:
-        saver.put(item, expire)
+            saver.put(item, expire)
 
+    _notify(item, expire, scheduler)
     return None, None
 
+async def put_in_async(item, expire, saver=aconn, scheduler=None):
+    """Save item with an async saver.
+
+     Args:
+         item: [(serialized, expire), ...] or serialized.
+         expire: None or expire as next validate time.
+         saver: async container to persistent save item according to the order of the expire.
+         scheduler: validator's scheduler to notify after saved, None to skip.
+    """
+    with metrics.saver_seconds.time(op='put'):
+        if config.dedupe != 'off' and hasattr(saver, 'put_unique'):
+            items = item if isinstance(item, list) else [(item, expire)]
+            await saver.put_unique(items, [member_identity(x) for x, _ in items], config.dedupe)
+        elif isinstance(item, list):
+            if hasattr(saver, 'put_list'):
+                await saver.put_list(item)
+            else:
+                for x in item:
+                    await saver.put(*x)
+        else:
+            await saver.put(item, expire)
+
+    _notify(item, expire, scheduler)
+    return None, None
+
+# one pass statements of middlewares on item 'i' and expire 'e', see fuse
+FUSIBLE = {
+    pack: (['i = {"item": i, "expire": e}'],
+           ['if e is None: raise TypeError("expire should not be None")',
+            'i = {"item": i, "expire": e}']),
+    unpack: (['e = i["expire"]', 'i = i["item"]'],) * 2,
+    serialize: (['i = member_serial(i)'],) * 2,
+    deserialize: (['i = member_deserial(i)'],) * 2,
+    update_expire: (['e = int(e + now)'],) * 2,
+}
+
+FUSED_TEMPLATE = """
+def {name}(item, expire):
+    now = time()
+    if isinstance(item, {types}):
+        items = []
+        append = items.append
+        for i, e in item:
+{batch}
+            append((i, e))
+        return items, expire
+    i, e = item, expire
+{single}
+    return i, e
+"""
+
+_fused = {}
+
+def _fuse_run(run):
+    """Compile middlewares in 'run' into one middleware doing them in one pass."""
+    if run not in _fused:
+        name = 'fused_{}'.format('_'.join(call.__name__ for call in run))
+        batch = [stmt for call in run for stmt in FUSIBLE[call][0]]
+        single = [stmt for call in run for stmt in FUSIBLE[call][1]]
+        src = FUSED_TEMPLATE.format(
+            name=name, types='(tuple, list)' if run[0] is pack else 'list',
+            batch='\n'.join(' ' * 12 + stmt for stmt in batch),
+            single='\n'.join(' ' * 4 + stmt for stmt in single))
+        namespace = {}
+        exec(src, globals(), namespace)
+        _fused[run] = namespace[name]
+    return _fused[run]
+
+def fuse(calls):
+    """Replace consecutive middlewares in FUSIBLE of 'calls' with fused ones.
+
+    A fused middleware does the same as the replaced ones without building
+    intermediate lists. Other middlewares, such as put_in or user's, were kept.
+    """
+    fused, run = [], []
+    for call in list(calls) + [None]:
+        if call in FUSIBLE:
+            run.append(call)
+            continue
+        if len(run) > 1:
+            fused.append(_fuse_run(tuple(run)))
+        else:
+            fused.extend(run)
+        run = []
+        if call is not None:
+            fused.append(call)
+    return fused
+
 def make_return(item, expire, is_strip):
     """Whether strip exprie before return."""
     if is_strip:
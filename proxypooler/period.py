@@ -0,0 +1,54 @@
+from proxypooler import config
+
+
+class FixedPeriod:
+    """Validate a proxy with the period it was put with, forever."""
+
+    def next_period(self, period, rate):
+        """Period in seconds to validate a passed proxy again after.
+
+        Args:
+            period: the period it was validated with.
+            rate: its rolling success rate, see RedisClient.record, None if unknown.
+        """
+        return period
+
+
+class AdaptivePeriod(FixedPeriod):
+    """Stretch the period of reliable proxies and shorten it for flaky ones.
+
+    Every pass of a proxy whose success rate was at least 'good_rate'(or unknown)
+    multiplied its period by 'stretch' up to 'longest', so proxies which kept passing
+    were validated less and less often. Passed proxies with a lower rate, such as the
+    ones failed before and put again, got their period multiplied by 'shrink' down to
+    'shortest'. Periods out of the bounds were left as they were put. Failed proxies
+    were dropped as before, and a stretched period never exceeded 'longest', so a
+    dead proxy stayed no longer than that.
+    """
+
+    def __init__(self, stretch=config.period_stretch, shrink=config.period_shrink,
+                 shortest=config.period_min, longest=config.period_max,
+                 good_rate=config.period_good_rate):
+        self.stretch = stretch
+        self.shrink = shrink
+        self.shortest = shortest
+        self.longest = longest
+        self.good_rate = good_rate
+
+    def next_period(self, period, rate):
+        if rate is None or rate >= self.good_rate:
+            return int(max(min(period * self.stretch, self.longest), period))
+        return int(min(max(period * self.shrink, self.shortest), period))
+
+
+POLICIES = {'fixed': FixedPeriod, 'adaptive': AdaptivePeriod}
+
+
+def get_policy(name=config.period_policy):
+    """Period policy by name, config.period_policy 'fixed' or 'adaptive' by default."""
+    return POLICIES[name]()
+
+
+def next_periods(policy, items, rates):
+    """Apply policy to passed items like [(proxy, period), ...] with their success rates."""
+    return [(proxy, policy.next_period(period, rate)) for (proxy, period), rate in zip(items, rates)]
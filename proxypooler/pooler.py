@@ -1,22 +1,30 @@
 import argparse
 import asyncio
+import inspect
+import itertools
 import re
+import threading
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from multiprocessing import Queue
 from random import random
-from time import sleep, time
+from time import time
 
 from aiohttp import WSCloseCode
-from aiohttp.web import Application, WebSocketResponse, WSMsgType, run_app
+from aiohttp.web import Application, Response, WebSocketResponse, WSMsgType, run_app
 
-from proxypooler import config
+from proxypooler import config, metrics
+from proxypooler.cache import ReadCache
+from proxypooler.db import MemorySaver, ShardedSaver, make_shards
+from proxypooler.engine import ValidateEngine
 from proxypooler.errors import ProxyPoolerEmptyError
-from proxypooler.ext import conn, deserial, serial, logger, server_logger
-from proxypooler.middlewares import (deserialize,
-                             make_return, pack, put_in,
+from proxypooler.ext import (aconn, conn, deserial, member_deserial, member_proxy, member_serial,
+                             serial, logger, server_logger)
+from proxypooler.middlewares import (deserialize, fuse,
+                             make_return, pack, put_in, put_in_async,
                              serialize, unpack, update_expire)
+from proxypooler.scheduler import DueScheduler, WheelScheduler
 from proxypooler.utils import get_ssl_context
 from proxypooler import task_validator
 
@@ -29,17 +37,62 @@ def get_address(request):
 
     return ''
 
+INJECTABLE = ('saver', 'scheduler')
+
+def injected(call):
+    """Names of the pooler's attributes which middleware 'call' accepts as keyword, like 'saver'."""
+    try:
+        params = inspect.signature(call).parameters
+    except ValueError: # builtins
+        return ()
+    return tuple(name for name in INJECTABLE if name in params)
+
 def middleware(calls, is_strip=False):
+    """Pass the return of decorated method through middlewares in 'calls'.
+
+    Middlewares accepting keywords in INJECTABLE, such as put_in's 'saver', get the
+    pooler's attribute of the same name.
+    Consecutive builtin middlewares like pack, serialize and update_expire were
+    fused into one pass when decorating, see middlewares.fuse.
+    """
+    def decorate(func):
+        fused = fuse(calls)
+        injects = [injected(call) for call in fused]
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            item, expire = func(self, *args, **kwargs)
+
+            if not item:
+                return make_return(None, None, is_strip)
+
+            for call, names in zip(fused, injects):
+                item, expire = call(item, expire, **{name: getattr(self, name) for name in names})
+                if not item:
+                    break
+
+            return make_return(item, expire, is_strip)
+        return wrapper
+    return decorate
+
+def async_middleware(calls, is_strip=False):
+    """The same as middleware, but decorate coroutine and await the middlewares which are coroutines."""
     def decorate(func):
+        fused = fuse(calls)
+        injects = [injected(call) for call in fused]
+
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            item, expire = func(*args, **kwargs)
+        async def wrapper(self, *args, **kwargs):
+            item, expire = await func(self, *args, **kwargs)
 
             if not item:
                 return make_return(None, None, is_strip)
 
-            for call in calls:
-                item, expire = call(item, expire)
+            for call, names in zip(fused, injects):
+                result = call(item, expire, **{name: getattr(self, name) for name in names})
+                if inspect.isawaitable(result):
+                    result = await result
+                item, expire = result
                 if not item:
                     break
 
@@ -47,17 +100,26 @@ def middleware(calls, is_strip=False):
         return wrapper
     return decorate
 
+def is_async_saver(saver):
+    return asyncio.iscoroutinefunction(getattr(saver, 'get', None))
+
 
 class Saver:
+    """Saver must has "get", "put" methods and "size" attr.
+
+    Async saver's "get", "put" and "size"(as method, not attr) must be coroutines.
+    """
 
     def __init__(self, saver_name):
         self.saver_name = saver_name
 
     def __set__(self, instance, obj):
-        if hasattr(obj, 'get') and hasattr(obj, 'put') and hasattr(obj, 'size'):
-            instance.__dict__[self.saver_name] = obj
-        else:
+        if not (hasattr(obj, 'get') and hasattr(obj, 'put') and hasattr(obj, 'size')):
             raise TypeError('"saver" must has "get"， "put" methods and “size” attr')
+        if is_async_saver(obj) and not (asyncio.iscoroutinefunction(obj.put) and
+                                        asyncio.iscoroutinefunction(obj.size)):
+            raise TypeError('async "saver" must has "get", "put" and "size" coroutines')
+        instance.__dict__[self.saver_name] = obj
 
     def __get__(self, instance, owner):
         if instance is None:
@@ -69,12 +131,39 @@ class Saver:
 class ProxyPooler:
     saver = Saver('saver')
 
-    def __init__(self, *, saver=conn):
+    def __init__(self, *, saver=conn, wheel=False, engine=False):
         self.saver = saver
+        if wheel:
+            self.scheduler = WheelScheduler()
+        else:
+            self.scheduler = DueScheduler()
         self.to_validate = set()
         self.queue = Queue()
         self.regex = re.compile(config.cmd_regex)
+        self.lease_regex = re.compile(config.lease_regex)
+        self.release_regex = re.compile(config.release_regex)
         self.pre_empty = False
+        self.peek_cursor = 0
+        self._peek_lock = threading.Lock()
+        self.leases = {} # proxy -> (leased item, lease deadline)
+        self._lease_lock = threading.Lock()
+        self._leases_purged_at = time()
+        self._ids_pruned_at = time()
+        self._health_pruned_at = time()
+        self.cache = ReadCache() if config.cache_size else None
+        record = self.record_async if config.latency_index else None
+        mark_dead = self.mark_dead_async if config.dead_ttl else None
+        self.engine = (ValidateEngine(self.put_passed_async, record=record, mark_dead=mark_dead)
+                       if engine else None)
+        # index of fast proxies, in saver if validated by the engine, otherwise in redis
+        # where celery workers record results, see task_validator.record. Failed proxies
+        # were remembered by saver itself, see mark_dead.
+        self.index = saver if engine else conn
+        self.rejected = 0 # proxies put again within config.dead_ttl seconds after they failed
+
+    @property
+    def saver_async(self):
+        return is_async_saver(self.saver)
 
     def _log_empty(self):
         if not self.pre_empty:
@@ -109,16 +198,21 @@ class ProxyPooler:
         Returns:
             packed items list such as ([{'item': item, 'expire': expire}, {...}, ...], None)
         """
-        if hasattr(self.saver, 'get_list'):
-            items = self.saver.get_list(count, rev)
-        else:
-            items = []
-            for _ in range(count):
-                try:
-                    item = self.saver.get(rev)
-                    items.append(item)
-                except ProxyPoolerEmptyError:
-                    break
+        return self._read_items(count, rev)
+
+    def _read_items(self, count, rev=False):
+        """Get a list serialized items like ([(serialized, expire), ...], None) from saver."""
+        with metrics.saver_seconds.time(op='get'):
+            if hasattr(self.saver, 'get_list'):
+                items = self.saver.get_list(count, rev)
+            else:
+                items = []
+                for _ in range(count):
+                    try:
+                        item = self.saver.get(rev)
+                        items.append(item)
+                    except ProxyPoolerEmptyError:
+                        break
 
         if items:
             self.pre_empty = False
@@ -135,7 +229,7 @@ class ProxyPooler:
         """
         return self._get_item()
 
-    @middleware(calls=[unpack], is_strip=True)
+    @middleware(calls=[deserialize, unpack], is_strip=True)
     def get_list(self, count, rev=False):
         """Get a list unpacked items.
 
@@ -146,27 +240,199 @@ class ProxyPooler:
         Returns:
             ([(item, expire), (...), ...], None)
         """
-        return self._get_items(count, rev)
+        return self._read_items(count, rev)
+
+    def _next_peek(self, count):
+        """Offset to peek count items from, later peeks get the following items."""
+        with self._peek_lock:
+            offset = self.peek_cursor
+            self.peek_cursor += count
+        return offset
+
+    @middleware(calls=[deserialize, unpack], is_strip=True)
+    def peek_list(self, count):
+        """Get a list unpacked items without removing them.
+
+        Items were read from the latest validated config.peek_window items round-robin,
+        so that every call got different items until the window was used up.
+
+        Returns:
+            ([(item, expire), (...), ...], None)
+        """
+        if count <= 0:
+            return [], None
+        return self.saver.peek_list(count, self._next_peek(count), config.peek_window), None
+
+    @async_middleware(calls=[deserialize, unpack], is_strip=True)
+    async def _peek_list_async(self, count):
+        if count <= 0:
+            return [], None
+        return await self.saver.peek_list(count, self._next_peek(count), config.peek_window), None
+
+    @staticmethod
+    def _lease_deadline(ttl):
+        return time() + min(ttl, config.lease_max_ttl)
+
+    def _leased(self, leased, deadline):
+        """Remember leased items for release, return them unpacked."""
+        items, _ = deserialize(leased, None)
+        now = time()
+        with self._lease_lock:
+            if now - self._leases_purged_at >= 60: # forget the lapsed leases
+                self.leases = {proxy: lease for proxy, lease in self.leases.items()
+                               if lease[1] > now}
+                self._leases_purged_at = now
+            for (item, _), (packed, _) in zip(leased, items):
+                self.leases[packed['item']] = (item, deadline)
+
+        if items:
+            self.pre_empty = False
+        else:
+            self._log_empty()
+        items, _ = unpack(items, None)
+        return items
+
+    def _lease_items(self, proxies):
+        with self._lease_lock:
+            return [self.leases.pop(proxy)[0] for proxy in proxies if proxy in self.leases]
+
+    def lease_list(self, count, ttl):
+        """Lease a list unpacked items exclusively for ttl seconds.
+
+        Leased items were out of pool(neither got nor validated) until released,
+        or put back automatically after ttl(at most config.lease_max_ttl).
+
+        Returns:
+            [(item, expire), (...), ...] like get_list.
+        """
+        deadline = self._lease_deadline(ttl)
+        return self._leased(self.saver.lease_list(count, deadline), deadline)
+
+    def release_list(self, proxies):
+        """Put leased proxies back to pool before their ttl passed.
+
+        Args:
+            proxies: [proxy1, proxy2, ...], proxies not leased by this pooler were ignored.
+
+        Returns:
+            the number of proxies put back.
+        """
+        released = self.saver.release_list(self._lease_items(proxies))
+        self.scheduler.notify(released)
+        return len(released)
+
+    def _reclaim_leases(self):
+        """Put items whose lease lapsed back to pool."""
+        if hasattr(self.saver, 'reclaim'):
+            self.scheduler.notify(self.saver.reclaim(time()))
+
+    def _prunes(self):
+        """Due saver calls like [(prune, args), ...], see middlewares.put_in and record."""
+        now = time()
+        prunes = []
+        if (config.dedupe != 'off' and hasattr(self.saver, 'prune_ids')
+                and now - self._ids_pruned_at >= config.dedupe_prune):
+            self._ids_pruned_at = now
+            prunes.append((self.saver.prune_ids, ()))
+        if (config.latency_index and hasattr(self.index, 'prune_health')
+                and now - self._health_pruned_at >= config.latency_prune):
+            self._health_pruned_at = now
+            prunes.append((self.index.prune_health, (now - config.latency_ttl,)))
+        return prunes
+
+    def _prune(self):
+        """Forget identities of proxies got from pool and proxies not validated for a while."""
+        for prune, args in self._prunes():
+            prune(*args)
+
+    def record(self, results, now):
+        """Record validate results like [(proxy, latency or None), ...] into the fast index.
+
+        Returns:
+            success rates of the proxies, see RedisClient.record.
+        """
+        return self.index.record(results, now)
+
+    def fast_list(self, count):
+        """Get count fastest proxies without removing them.
+
+        Proxies were ordered by their rolling validate latency divided by rolling success
+        rate, only proxies passed the last validate were included.
+
+        Returns:
+            [(proxy, seconds), (...), ...]
+        """
+        return self._fast_items(self.index.fastest(count))
+
+    @staticmethod
+    def _fast_items(items):
+        return [(proxy.decode('utf-8') if isinstance(proxy, bytes) else proxy, round(latency, 3))
+                for proxy, latency in items]
+
+    def stats(self):
+        """Like {'size': size of pool, 'duplicates': the number of collapsed puts}."""
+        if hasattr(self.saver, 'stats'):
+            return self.saver.stats()
+        return {'size': self.size, 'duplicates': 0}
+
+    def mark_dead(self, proxies):
+        """Reject proxies put within config.dead_ttl seconds from now, see RedisClient.mark_dead."""
+        self.saver.mark_dead(proxies, time(), config.dead_ttl, config.dead_size)
+
+    def _alive(self, items, dead):
+        alive = [x for x, is_dead in zip(items, dead) if not is_dead]
+        self.rejected += len(items) - len(alive)
+        metrics.rejected.inc(len(items) - len(alive))
+        return alive
+
+    def _reject_dead(self, items):
+        """Items like [(proxy, period), ...] not failed within config.dead_ttl seconds.
+
+        All items were kept if saver failed to look them up, the dead index was only a hint.
+        """
+        if not config.dead_ttl or not items or not hasattr(self.saver, 'is_dead'):
+            return items
+        try:
+            dead = self.saver.is_dead([proxy for proxy, _ in items], time() - config.dead_ttl)
+        except Exception as exc:
+            logger.warning('failed to look up {} dead proxies: {!r}'.format(len(items), exc))
+            return items
+        return self._alive(items, dead)
 
     @middleware(calls=[pack, serialize, update_expire, put_in])
     def put(self, item, expire):
         """Put a unpacked item with expire as its validate period.
 
+        Proxies failed recently were dropped, see mark_dead.
+
         Returns:
             pass to middlewares.
         """
+        if not self._reject_dead([(item, expire)]):
+            return None, None
         return item, expire
 
     @middleware(calls=[pack, serialize, update_expire, put_in])
     def put_list(self, items):
         """Put a list unpacked items with expire as its validate period.
 
+        Proxies failed recently were dropped, see mark_dead.
+
         Args:
             items: [(item, expire), (...), ...]
 
         Returns:
             pass to middlewares.
         """
+        return self._reject_dead(items), None
+
+    @middleware(calls=[pack, serialize, update_expire, put_in])
+    def put_passed(self, items):
+        """Put back items like [(item, expire), ...] passed validate just now.
+
+        Unlike put_list they were never dropped as failed recently, another copy of a
+        proxy with a different period might have failed meanwhile.
+        """
         return items, None
 
     @middleware(calls=[serialize, put_in])
@@ -198,16 +464,198 @@ class ProxyPooler:
     def size(self):
         return self.saver.size
 
+    async def _read_items_async(self, count, rev=False):
+        """Get a list serialized items from async saver, the same as _read_items."""
+        with metrics.saver_seconds.time(op='get'):
+            if hasattr(self.saver, 'get_list'):
+                items = await self.saver.get_list(count, rev)
+            else:
+                items = []
+                for _ in range(count):
+                    try:
+                        item = await self.saver.get()
+                        items.append(item)
+                    except ProxyPoolerEmptyError:
+                        break
+
+        if items:
+            self.pre_empty = False
+        else:
+            self._log_empty()
+        return items, None
+
+    @async_middleware(calls=[deserialize, unpack], is_strip=True)
+    async def _get_list_async(self, count, rev=False):
+        return await self._read_items_async(count, rev)
+
+    async def _reject_dead_async(self, items):
+        if not config.dead_ttl or not items or not hasattr(self.saver, 'is_dead'):
+            return items
+        if not self.saver_async:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self._reject_dead, items)
+        try:
+            dead = await self.saver.is_dead([proxy for proxy, _ in items],
+                                            time() - config.dead_ttl)
+        except Exception as exc:
+            logger.warning('failed to look up {} dead proxies: {!r}'.format(len(items), exc))
+            return items
+        return self._alive(items, dead)
+
+    @async_middleware(calls=[pack, serialize, update_expire, put_in_async])
+    async def _put_list_async(self, items):
+        return await self._reject_dead_async(items), None
+
+    @async_middleware(calls=[pack, serialize, update_expire, put_in_async])
+    async def _put_passed_async(self, items):
+        return items, None
+
+    async def get_list_async(self, count, rev=False):
+        """get_list without blocking the event loop.
+
+        Await async saver directly, otherwise run get_list in the default executor.
+        """
+        if self.saver_async:
+            return await self._get_list_async(count, rev)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.get_list, count, rev)
+
+    async def peek_list_async(self, count):
+        """peek_list without blocking the event loop, the same way as get_list_async."""
+        if self.saver_async:
+            return await self._peek_list_async(count)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.peek_list, count)
+
+    @staticmethod
+    def _scored(items):
+        """[(serialized, score), ...] of saver to [(score, (item, expire)), ...]."""
+        items, _ = deserialize(items, None)
+        return [(score, (item['item'], item['expire'])) for item, score in items or ()]
+
+    async def _read_newer_async(self, latest):
+        """Read latest validated items of saver for cache, only those newer than 'latest' if not None."""
+        size = self.cache.size
+        if latest is None:
+            read, args = self.saver.peek_list, (size, 0, size)
+        else:
+            read, args = self.saver.peek_newer, (latest, size)
+        if self.saver_async:
+            items = await read(*args)
+        else:
+            loop = asyncio.get_event_loop()
+            items = await loop.run_in_executor(None, read, *args)
+        return self._scored(items)
+
+    async def peek_bytes_async(self, count):
+        """Serialized 'get N peek' reply from cache.
+
+        Cache was reloaded when older than config.cache_max_age, and refreshed with newer
+        validated items every config.cache_refresh seconds, otherwise nothing was read.
+
+        Returns:
+            (the number of items, serialized [(item, expire), ...]).
+        """
+        cache = self.cache
+        if cache.needs_load():
+            cache.load(await self._read_newer_async(None))
+            cache.misses += 1
+        elif cache.needs_refresh():
+            cache.merge(await self._read_newer_async(cache.latest))
+            cache.misses += 1
+        else:
+            cache.hits += 1
+        return cache.get(count)
+
+    async def lease_list_async(self, count, ttl):
+        """lease_list without blocking the event loop, the same way as get_list_async."""
+        if self.saver_async:
+            deadline = self._lease_deadline(ttl)
+            return self._leased(await self.saver.lease_list(count, deadline), deadline)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.lease_list, count, ttl)
+
+    async def release_list_async(self, proxies):
+        if self.saver_async:
+            released = await self.saver.release_list(self._lease_items(proxies))
+            self.scheduler.notify(released)
+            return len(released)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.release_list, proxies)
+
+    async def _reclaim_leases_async(self):
+        if hasattr(self.saver, 'reclaim'):
+            self.scheduler.notify(await self.saver.reclaim(time()))
+
+    async def _prune_async(self):
+        for prune, args in self._prunes():
+            if asyncio.iscoroutinefunction(prune):
+                await prune(*args)
+            else:
+                await asyncio.get_event_loop().run_in_executor(None, prune, *args)
+
+    async def record_async(self, results, now):
+        if is_async_saver(self.index):
+            return await self.index.record(results, now)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.record, results, now)
+
+    async def mark_dead_async(self, proxies):
+        if self.saver_async:
+            return await self.saver.mark_dead(proxies, time(), config.dead_ttl, config.dead_size)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.mark_dead, proxies)
+
+    async def fast_list_async(self, count):
+        if is_async_saver(self.index):
+            return self._fast_items(await self.index.fastest(count))
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.fast_list, count)
+
+    async def stats_async(self):
+        if self.saver_async:
+            return await self.saver.stats()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.stats)
+
+    async def put_list_async(self, items):
+        """put_list without blocking the event loop, the same way as get_list_async."""
+        if self.saver_async:
+            return await self._put_list_async(items)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.put_list, items)
+
+    async def put_passed_async(self, items):
+        """put_passed without blocking the event loop, for the engine and sender."""
+        if self.saver_async:
+            return await self._put_passed_async(items)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.put_passed, items)
+
+    async def size_async(self):
+        if self.saver_async:
+            return await self.saver.size()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self.size)
+
     async def handler(self, request):
         """websocket handler.
 
         Data Format:
             serialized bytes data like [(proxy1, expire), (proxy2, expire), ...].
             The 'expire' was validate period in seconds of proxy.
+            Replied 'ack', or 'ack SEQ' for the sender's frame like {'seq': SEQ, 'items': [...]}.
 
         Cmd Format:
             'get': return the latest validated proxy.
             'get N': return the latest N(integer type) validated proxies.
+            'get N peek': return N of the latest validated proxies without removing them,
+                          round-robin over the latest config.peek_window proxies,
+                          or over the server's cache of config.cache_size proxies if enabled.
+            'get N fast': return N fastest validated proxies like [(proxy, seconds), ...]
+                          without removing them, see fast_list.
+            'lease N TTL': lease the latest N validated proxies for TTL seconds.
+            'release PROXY1 PROXY2 ...': put leased proxies back, return 'ack'.
         """
         ws = WebSocketResponse()
         await ws.prepare(request)
@@ -217,26 +665,65 @@ class ProxyPooler:
             async for msg in ws:
                 if msg.type == WSMsgType.BINARY:
                     items = deserial(msg.data)
+                    ack = 'ack'
+                    source = 'client'
+                    if isinstance(items, dict): # frame of sender
+                        ack = 'ack {}'.format(items['seq'])
+                        items = items['items']
+                        source = 'sender'
                     if isinstance(items, tuple):
                         server_logger.info("----> got {} item(s)".format(len(items)),
                                            extra={'address': get_address(request)})
-                        ws.send_str('ack')
-                        self.put_list(items)
+                        metrics.ingested.inc(len(items), source=source)
+                        ws.send_str(ack)
+                        if source == 'sender': # passed celery validators just now
+                            await self.put_passed_async(items)
+                        else:
+                            await self.put_list_async(items)
                 elif msg.type == WSMsgType.TEXT:
                     remote = get_address(request)
                     server_logger.info("----> received cmd {}".format(msg.data),
                                        extra={'address': remote})
+                    items = None
                     r = self.regex.match(msg.data)
+                    lease = self.lease_regex.match(msg.data)
+                    release = self.release_regex.match(msg.data)
                     if r is not None:
-                        count = r.group(1)
-                        count = int(count) if count else 1
-                        items = self.get_list(count, rev=True)
+                        cmd = r.group(2) or 'get'
+                    else:
+                        cmd = 'lease' if lease else 'release' if release else 'unknown'
+                    with metrics.command_seconds.time(cmd=cmd):
+                        if r is not None:
+                            count = r.group(1)
+                            count = int(count) if count else 1
+                            if r.group(2) == 'peek' and self.cache is not None:
+                                n, data = await self.peek_bytes_async(count)
+                                if n:
+                                    ws.send_bytes(data)
+                                    metrics.served.inc(n, cmd=cmd)
+                                    server_logger.info("<---- sent {} item(s)".format(n),
+                                                       extra={'address': remote})
+                                    continue
+                            elif r.group(2) == 'peek':
+                                items = await self.peek_list_async(count)
+                            elif r.group(2) == 'fast':
+                                items = await self.fast_list_async(count)
+                            else:
+                                items = await self.get_list_async(count, rev=True)
+                        elif lease is not None:
+                            count, ttl = int(lease.group(1)), int(lease.group(2))
+                            items = await self.lease_list_async(count, ttl)
+                        elif release is not None:
+                            await self.release_list_async(release.group(1).split())
+                            ws.send_str('ack')
+                            continue
                         if items:
                             ws.send_bytes(serial(items))
+                            metrics.served.inc(len(items), cmd=cmd)
                             server_logger.info("<---- sent {} item(s)".format(len(items)),
                                                extra={'address': remote})
                             continue
-                    ws.send_str('')
+                        ws.send_str('')
                 elif (msg.type == WSMsgType.ERROR or
                       msg.type == WSMsgType.CLOSE):
                     break
@@ -249,35 +736,221 @@ class ProxyPooler:
 
         return ws
         
-    def _get_validates(self):
-        """Send expired proxy to validator."""
+    @middleware(calls=[deserialize])
+    def _get_due_items(self, now, count):
+        """Get a list packed items whose expire <= now.
+
+        Returns:
+            packed items list such as ([{'item': item, 'expire': expire}, {...}, ...], None)
+        """
+        with metrics.saver_seconds.time(op='get_due'):
+            return self.saver.get_due(now, count), None
+
+    @async_middleware(calls=[deserialize])
+    async def _get_due_items_async(self, now, count):
+        with metrics.saver_seconds.time(op='get_due'):
+            return await self.saver.get_due(now, count), None
+
+    def _dispatch(self, items):
+        """Validate unpacked due items like [({'item': proxy, 'expire': expire}, score), ...].
+
+        Items were sent to the engine if enabled, otherwise one celery task per
+        config.validate_batch_size items.
+        """
+        items = [item for item, _ in items]
+        metrics.dispatched.inc(len(items))
+        if self.engine is not None:
+            self.engine.submit(items)
+        elif config.validate_batch_size > 1:
+            for start in range(0, len(items), config.validate_batch_size):
+                task_validator.validate_batch.delay(items[start:start + config.validate_batch_size])
+        else:
+            for item in items:
+                task_validator.validate.delay(item)
+
+    @staticmethod
+    def _split_expired(items):
+        """Split packed items sorted by expire into (expired, not expired)."""
+        now = time()
+        for end, (_, expire) in enumerate(items):
+            if expire > now:
+                return items[:end], items[end:]
+        return items, []
+
+    def _quota(self, count=config.validate_count):
+        """Due items to pop at a time, count at most, limited by room of the engine."""
+        if self.engine is None:
+            return count
+        return min(self.engine.room(), count)
+
+    def _poll_validates(self):
+        """Send expired proxy to validator, for saver without "get_due"."""
         while 1:
-            items, _ = self._get_items(10)
+            count = self._quota(10)
+            if not count:
+                break
+            items, _ = self._get_items(count)
             if not items:
                 break
 
-            item, expire = items[0]
-            if expire > time():
+            expired, items = self._split_expired(items)
+            if items:
                 self._put_items(items)
+
+            self._dispatch(expired)
+
+            if items:
                 break
 
-            item, expire = items[-1]
-            if expire > time():
-                for end, (_, expire) in enumerate(items[1:], start=1):
-                    if expire > time():
-                        break
-                self._put_items(items[end:])
-            else:
-                end = len(items)
+    def _wheel_validates(self):
+        """Send expired proxy to validator, due items were found by timing wheel.
 
-            for item, _ in items[:end]:
-                task_validator.validate.delay(item)
+        Due items were claimed from saver config.validate_count items at a time,
+        items taken by others were skipped and items put again with later expire
+        were scheduled again.
+        """
+        if self.scheduler.needs_sync():
+            self.scheduler.load(self.saver.scan())
+
+        due = self.scheduler.due(time())
+        while due:
+            count = self._quota()
+            if not count:
+                break
+            claimed, later = self.saver.claim([item for item, _ in due[:count]], time())
+            self.scheduler.notify(later)
+            due = due[count:]
+
+            items, _ = deserialize(claimed, None)
+            self._dispatch(items)
+        self.scheduler.notify(due) # due again at the next tick
+
+    async def _wheel_validates_async(self):
+        if self.scheduler.needs_sync():
+            self.scheduler.load(await self.saver.scan())
+
+        due = self.scheduler.due(time())
+        while due:
+            count = self._quota()
+            if not count:
+                break
+            claimed, later = await self.saver.claim([item for item, _ in due[:count]], time())
+            self.scheduler.notify(later)
+            due = due[count:]
+
+            items, _ = deserialize(claimed, None)
+            self._dispatch(items)
+        self.scheduler.notify(due)
+
+    def _get_validates(self):
+        """Send expired proxy to validator.
+
+        Only due items were popped from saver, config.validate_count items at a time,
+        and no more than the engine had room for.
+        """
+        self._reclaim_leases()
+        self._prune()
+        if isinstance(self.scheduler, WheelScheduler):
+            return self._wheel_validates()
+        if not hasattr(self.saver, 'get_due'):
+            return self._poll_validates()
+
+        while 1:
+            count = self._quota()
+            if not count:
+                break
+            items, _ = self._get_due_items(time(), count)
+            if not items:
+                break
+
+            self._dispatch(items)
+
+            if len(items) < count:
+                break
+
+    async def _get_validates_async(self):
+        """Send expired proxy to validator with async saver."""
+        await self._reclaim_leases_async()
+        await self._prune_async()
+        if isinstance(self.scheduler, WheelScheduler):
+            return await self._wheel_validates_async()
+
+        while 1:
+            count = self._quota()
+            if not count:
+                break
+            items, _ = await self._get_due_items_async(time(), count)
+            if not items:
+                break
+
+            self._dispatch(items)
+
+            if len(items) < count:
+                break
 
     def send_validator(self):
-        """Proxy validator."""
+        """Proxy validator.
+
+        Sleep until the next item expired, see DueScheduler.
+        """
         while 1:
+            self.scheduler.clear()
             self._get_validates()
-            sleep(random())
+            metrics.pool_size.set(self.size)
+            if self._quota() == 0: # due items waited in saver for the engine
+                next_due = time() + config.engine_flush
+            elif isinstance(self.scheduler, WheelScheduler):
+                next_due = self.scheduler.next_tick()
+            elif hasattr(self.saver, 'next_due'):
+                next_due = self.saver.next_due()
+            else:
+                next_due = time() + random()
+            self.scheduler.wait(next_due)
+
+    async def send_validator_async(self):
+        """Proxy validator with async saver."""
+        while 1:
+            self.scheduler.clear()
+            await self._get_validates_async()
+            metrics.pool_size.set(await self.saver.size())
+            if self._quota() == 0:
+                next_due = time() + config.engine_flush
+            elif isinstance(self.scheduler, WheelScheduler):
+                next_due = self.scheduler.next_tick()
+            else:
+                next_due = await self.saver.next_due()
+            await self.scheduler.wait_async(next_due)
+
+    async def metrics_handler(self, request):
+        """Metrics in Prometheus text format, see metrics.py."""
+        if 'websockets' in request.app: # server
+            metrics.websockets.set(len(request.app['websockets']))
+            metrics.pool_size.set(await self.size_async())
+        if hasattr(self.saver, 'validated'): # counted by celery validators
+            try:
+                if self.saver_async:
+                    counts = await self.saver.validated()
+                else:
+                    counts = await asyncio.get_event_loop().run_in_executor(None, self.saver.validated)
+            except Exception as exc:
+                logger.warning('failed to read validate counts: {!r}'.format(exc))
+            else:
+                for result, n in counts.items():
+                    metrics.celery_validated.set(n, result=result)
+        return Response(text=metrics.render(), content_type='text/plain')
+
+    def start_metrics(self, host, port):
+        """Serve '/metrics' in a daemon thread, for the validator running without server."""
+        app = Application()
+        app.router.add_route('GET', '/metrics', self.metrics_handler)
+        loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(loop.create_server(app.make_handler(), host, port))
+            loop.run_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
 
     def start_server(self, host, port):
         """Server to receive proxies and other commands through websocket."""
@@ -294,18 +967,64 @@ class ProxyPooler:
         app = Application()
         app['websockets'] = []
         app.router.add_route('GET', '/connect', self.handler)
+        app.router.add_route('GET', '/metrics', self.metrics_handler)
         app.on_shutdown.append(on_shutdown)
         run_app(app, host=host, port=port, ssl_context=ssl_context,
                 print=lambda s: print(s.replace('CTRL+C', 'CTRL+C,CTRL+\\')))
 
-    def start(self):
-        """Start validator and server."""
-        asyncio_loop = asyncio.get_event_loop()
+    def start_validator(self, loop):
+        """Schedule validator(and engine if enabled) in 'loop'.
+
+        Returns:
+            future of the validator.
+        """
+        if self.engine is not None:
+            self.engine.start(loop)
+        if self.saver_async:
+            return loop.create_task(self.send_validator_async())
         executor = ThreadPoolExecutor(max_workers=1)
-        asyncio_loop.run_in_executor(executor, self.send_validator)
+        return loop.run_in_executor(executor, self.send_validator)
 
+    def start(self):
+        """Start validator and server."""
+        self.start_validator(asyncio.get_event_loop())
         self.start_server(config.local_host, config.local_port)
 
+def get_saver():
+    """Saver chosen by config.saver."""
+    if config.saver == 'memory':
+        return MemorySaver(config.memory_snapshot or None, config.memory_snapshot_interval)
+    elif config.saver == 'async_redis':
+        return aconn
+    elif config.saver == 'sharded':
+        return ShardedSaver(make_shards(), config.validate_shards, identity=member_proxy)
+    else:
+        return conn
+
+def migrate(saver, chunk_size=config.put_chunk_size):
+    """Rewrite all items in saver with the serializer chosen by config.codec.
+
+    Items were replaced config.put_chunk_size at a time keeping their expire, items
+    popped meanwhile were not put back. Leased items were rewritten when put again.
+
+    Returns:
+        the number of rewritten items.
+    """
+    replaced = 0
+    pairs = []
+    if isinstance(saver, ShardedSaver): # all shards, not only the validated ones
+        items = itertools.chain.from_iterable(shard.scan() for shard in saver.shards)
+    else:
+        items = saver.scan()
+    for item, _ in items:
+        new = member_serial(member_deserial(item))
+        if new != item:
+            pairs.append((item, new))
+        if len(pairs) >= chunk_size:
+            replaced += saver.replace_list(pairs)
+            pairs = []
+    return replaced + saver.replace_list(pairs)
+
 def run():
     parser = argparse.ArgumentParser(description='Start ProxyPooler')
 
@@ -315,20 +1034,48 @@ def run():
     parser.add_argument('-s', '--server', dest='server', action='store_true',
                         help='start server')
 
+    parser.add_argument('-e', '--engine', dest='engine', action='store_true',
+                        help='validate proxies with the asyncio engine instead of celery')
+
+    parser.add_argument('-m', '--migrate', dest='migrate', action='store_true',
+                        help='rewrite all proxies in saver with config.codec and exit')
+
     args = parser.parse_args()
 
-    p = ProxyPooler()
+    if args.migrate:
+        saver = get_saver()
+        saver = conn if saver is aconn else saver
+        print('{} proxies rewritten'.format(migrate(saver)))
+        if isinstance(saver, MemorySaver) and saver.snapshot_path:
+            saver.snapshot()
+        return
+
+    p = ProxyPooler(saver=get_saver(), wheel=config.validate_wheel,
+                    engine=args.engine or config.validate_engine)
     logger.info('proxypooler started')
+    if config.dead_ttl and p.engine is None and isinstance(p.saver, MemorySaver):
+        logger.warning("dead_ttl had no effect with saver 'memory' and celery validators, "
+                       "they marked failed proxies in redis, validate with the engine(-e) instead")
     try:
         if not args.validator and not args.server:
             p.start()
         elif args.validator:
             logger.info('validator start')
-            p.send_validator()
+            if config.metrics_port:
+                p.start_metrics(config.local_host, config.metrics_port)
+            if p.engine is not None:
+                loop = asyncio.get_event_loop()
+                loop.run_until_complete(p.start_validator(loop))
+            elif p.saver_async:
+                asyncio.get_event_loop().run_until_complete(p.send_validator_async())
+            else:
+                p.send_validator()
         elif args.server:
             logger.info('server start')
             p.start_server(config.local_host, config.local_port)
     finally:
+        if isinstance(p.saver, MemorySaver) and p.saver.snapshot_path:
+            p.saver.snapshot()
         logger.info('proxypooler stopped')
 
 
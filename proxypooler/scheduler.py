@@ -0,0 +1,197 @@
+import asyncio
+import threading
+from math import ceil, floor
+from time import time
+
+from proxypooler import config
+
+
+class DueScheduler:
+    """Decide how long the validator sleeps.
+
+    The validator sleeps until the earliest expire in saver, at most max_wait seconds,
+    and was woken up early when an item expiring earlier was put in the same process.
+
+    Attributes:
+        next_due: the expire validator was sleeping for, None if saver was empty.
+    """
+
+    def __init__(self, max_wait=config.validate_max_wait):
+        self.max_wait = max_wait
+        self.next_due = None
+        self._event = threading.Event()
+
+    def notify(self, items):
+        """Items like [(item, expire), ...] were put."""
+        if not items:
+            return
+        expire = min(expire for _, expire in items)
+        next_due = self.next_due
+        if next_due is None or expire < next_due:
+            self.next_due = expire
+            self._event.set()
+
+    def clear(self):
+        """Forget notifications, call before looking for due items."""
+        self._event.clear()
+
+    def _timeout(self, next_due):
+        self.next_due = next_due
+        if next_due is None:
+            return self.max_wait
+        return min(max(next_due - time(), 0), self.max_wait)
+
+    def wait(self, next_due):
+        """Sleep until 'next_due' or notified."""
+        self._event.wait(self._timeout(next_due))
+
+    async def wait_async(self, next_due):
+        timeout = self._timeout(next_due)
+        if timeout > 0:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._event.wait, timeout)
+
+
+class TimingWheel:
+    """Hierarchical timing wheel of items and their expire.
+
+    Level 0 has 'slots' buckets of 'tick' seconds, each bucket of level i covers
+    slots ** i ticks. An item sits in the lowest level whose higher digits(in base
+    'slots') of its due tick were the same as the current tick's, and was cascaded
+    down when the current tick reached its bucket. Items beyond the top level wait
+    in overflow. Add, remove and dispatch were O(1) per item.
+
+    Attributes:
+        current: the last dispatched tick.
+    """
+
+    def __init__(self, tick=1, slots=256, levels=4, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = floor((time() if now is None else now) / tick)
+        self._buckets = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._overflow = set()
+        self._ready = set() # due when added
+        self._items = {} # item -> (expire, bucket)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def _place(self, item, expire):
+        due = ceil(expire / self.tick)
+        if due <= self.current:
+            bucket = self._ready
+        else:
+            bucket = self._overflow
+            span = 1
+            for level in range(self.levels):
+                if due // (span * self.slots) == self.current // (span * self.slots):
+                    bucket = self._buckets[level][due // span % self.slots]
+                    break
+                span *= self.slots
+        bucket.add(item)
+        self._items[item] = (expire, bucket)
+
+    def add(self, item, expire):
+        """Add item, or move it if it was in wheel."""
+        self.remove(item)
+        self._place(item, expire)
+
+    def remove(self, item):
+        if item in self._items:
+            _, bucket = self._items.pop(item)
+            bucket.discard(item)
+
+    def _collect(self, bucket, due):
+        for item in bucket:
+            due.append((item, self._items.pop(item)[0]))
+        bucket.clear()
+
+    def _replace(self, bucket):
+        items = list(bucket)
+        bucket.clear()
+        for item in items:
+            self._place(item, self._items[item][0])
+
+    def _cascade(self):
+        """Move items of the higher levels' buckets which the current tick reached down."""
+        if self.current % self.slots:
+            return
+        if self.current % self.slots ** self.levels == 0:
+            self._replace(self._overflow)
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if self.current % span == 0:
+                self._replace(self._buckets[level][self.current // span % self.slots])
+
+    def advance(self, now):
+        """Move to 'now' and remove all due items.
+
+        Returns:
+            [(item, expire), ...] whose expire <= now.
+        """
+        target = floor(now / self.tick)
+        due = []
+        self._collect(self._ready, due)
+        while self.current < target:
+            if not self._items:
+                self.current = target
+                break
+            self.current += 1
+            self._cascade()
+            self._collect(self._buckets[0][self.current % self.slots], due)
+        self._collect(self._ready, due) # cascaded items due at current tick
+        return due
+
+    def next_tick(self):
+        """Time of the next tick."""
+        return (self.current + 1) * self.tick
+
+
+class WheelScheduler(DueScheduler):
+    """Find due items with a TimingWheel holding all items of saver.
+
+    Saver was only used as durable storage, the wheel was loaded from it on start
+    and every 'resync' seconds(to pick up items put by other processes), and kept
+    in sync on put in the same process.
+    """
+
+    def __init__(self, tick=config.wheel_tick, slots=config.wheel_slots,
+                 levels=config.wheel_levels, resync=config.wheel_resync,
+                 max_wait=config.validate_max_wait):
+        super().__init__(max_wait)
+        self.wheel = TimingWheel(tick, slots, levels)
+        self.resync = resync
+        self._synced_at = None
+        self._lock = threading.Lock() # put in server thread, advance in validator thread
+
+    def notify(self, items):
+        with self._lock:
+            for item, expire in items:
+                self.wheel.add(item, expire)
+
+    def needs_sync(self):
+        return self._synced_at is None or time() - self._synced_at >= self.resync
+
+    def load(self, items, chunk_size=10000):
+        """Load items like [(item, expire), ...] of saver, puts were not blocked for long."""
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                self.notify(chunk)
+                chunk = []
+        self.notify(chunk)
+        self._synced_at = time()
+
+    def due(self, now):
+        """Remove and return due items like [(item, expire), ...]."""
+        with self._lock:
+            return self.wheel.advance(now)
+
+    def next_tick(self):
+        return self.wheel.next_tick()
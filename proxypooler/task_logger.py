@@ -17,8 +17,8 @@ server_debug_logger = logging.getLogger('server_debug_logger')
 debug_logger = logging.getLogger('debug_logger')
 file_logger = logging.getLogger('file_logger')
 
-@task()
-def log(name, lvl, msg, *args, **kwargs):
+def write(name, lvl, msg, *args, **kwargs):
+    """Write one record to the loggers of project 'name'."""
     if name == config.project_srv:
         logger_file = server_logger
         logger_stream = server_debug_logger
@@ -32,3 +32,7 @@ def log(name, lvl, msg, *args, **kwargs):
         getattr(logger_file, lvl, 'info')(msg, *args, **kwargs) # server logging everything to file
     if lvl in ('error', 'critical'):
         getattr(logger_file, lvl, 'error')(msg, *args, **kwargs) # only logging  errors
+
+@task()
+def log(name, lvl, msg, *args, **kwargs):
+    write(name, lvl, msg, *args, **kwargs)
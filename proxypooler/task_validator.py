@@ -1,19 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
 from random import choice
+from time import time
 
 import requests
 from celery import task
 
 from proxypooler import config
+from proxypooler.db import ShardedSaver, make_shards
 from proxypooler.ext import serial
-from proxypooler.ext import logger, validator_pub_queue
+from proxypooler.ext import conn, logger, member_proxy, validator_pub_queue
+from proxypooler.middlewares import fuse, pack, put_in, serialize, update_expire
+from proxypooler.period import get_policy, next_periods
+from proxypooler.probe import probe
 
 
-@task()
-def validate(item):
-    proxy, expire = item['item'], item['expire']
+# saver of the server, passed proxies were put into and failed ones marked in it
+saver = ShardedSaver(make_shards(), identity=member_proxy) if config.saver == 'sharded' else conn
+put_calls = fuse([pack, serialize, update_expire])
+policy = get_policy()
+
+
+def check(proxy):
+    """Seconds validate_url took to be fetched through proxy, None if it failed."""
     logger.info('-proxy: {0}'.format(proxy))
     proxies = {'http': proxy}
-    headers = config.headers.dict()
+    headers = dict(config.headers.dict())
     headers['User-Agent'] = choice(config.user_agent)
     headers['Pragma']  = 'no-cache'
     try:
@@ -21,9 +32,97 @@ def validate(item):
                                 proxies=proxies, timeout=config.validate_timeout)
         if response.status_code != 200:
             logger.info('proxy {} expired'.format(proxy))
-        else:
-            msg = serial([(proxy, expire)])
-            validator_pub_queue.put(msg, 'proxypooler.validator.passed') # validated proxies put into rabbitmq
-            logger.info('proxy {} passed'.format(proxy))
+            return None
+        logger.info('proxy {} passed'.format(proxy))
+        return response.elapsed.total_seconds()
     except requests.exceptions.RequestException as exc:
         logger.warning('proxy {0} expired with error: {1!r}'.format(proxy, exc))
+        return None
+
+
+def record(results):
+    """Record [(proxy, latency), ...] into the fast index of ext.conn, see RedisClient.record.
+
+    Returns:
+        success rates of the proxies, None if unknown.
+    """
+    if config.latency_index:
+        try:
+            return conn.record(results, time())
+        except Exception as exc: # the index was only a hint, never lose passed proxies for it
+            logger.warning('failed to record {} results: {!r}'.format(len(results), exc))
+    return [None] * len(results)
+
+
+def count(passed, failed, unreachable):
+    """Count validate results in the saver of the server, exported by its '/metrics'.
+
+    'failed' did not include 'unreachable', the same as proxypooler_validated_total.
+    """
+    try:
+        saver.count_validated({'passed': passed, 'failed': failed, 'unreachable': unreachable})
+    except Exception as exc:
+        logger.warning('failed to count validate results: {!r}'.format(exc))
+
+
+def mark_dead(proxies):
+    """Reject failed proxies put again within config.dead_ttl seconds, see RedisClient.mark_dead."""
+    if config.dead_ttl and proxies:
+        try:
+            saver.mark_dead(proxies, time(), config.dead_ttl, config.dead_size)
+        except Exception as exc:
+            logger.warning('failed to mark {} proxies dead: {!r}'.format(len(proxies), exc))
+
+
+def put_passed(items):
+    """Put passed proxies like [(proxy, expire), ...] back.
+
+    With config.validate_reinsert 'direct' they were put into the saver of the server,
+    ext.conn or the shards of saver 'sharded', with the next validate time at once, the
+    same way as ProxyPooler.put_list, otherwise put into rabbitmq for sender.
+    """
+    if config.validate_reinsert == 'direct':
+        item, expire = list(items), None
+        for call in put_calls:
+            item, expire = call(item, expire)
+        put_in(item, expire, saver=saver)
+    else:
+        validator_pub_queue.put(serial(items), 'proxypooler.validator.passed') # validated proxies put into rabbitmq
+
+
+@task()
+def validate(item):
+    proxy, expire = item['item'], item['expire']
+    reachable = probe(proxy)
+    latency = check(proxy) if reachable else None
+    count(int(latency is not None), int(reachable and latency is None), int(not reachable))
+    rates = record([(proxy, latency)])
+    if latency is not None:
+        put_passed(next_periods(policy, [(proxy, expire)], rates))
+    else:
+        mark_dead([proxy])
+
+
+@task(ignore_result=True)
+def validate_batch(items):
+    """Validate items like [{'item': proxy, 'expire': expire}, ...] concurrently.
+
+    All proxies were probed by TCP connect first, only the reachable ones were checked
+    through HTTP. All passed proxies were put back together with periods from the
+    period policy, see put_passed.
+    """
+    proxies = [item['item'] for item in items]
+    # a pool of its own, so config.validate_batch_workers was per task, green threads under eventlet
+    with ThreadPoolExecutor(max_workers=config.validate_batch_workers) as executor:
+        reachable = [proxy for proxy, ok in zip(proxies, executor.map(probe, proxies)) if ok]
+        latencies = dict(zip(reachable, executor.map(check, reachable)))
+    results = [(proxy, latencies.get(proxy)) for proxy in proxies]
+    rates = record(results)
+    passed = [(item['item'], policy.next_period(item['expire'], rate))
+              for item, (_, latency), rate in zip(items, results, rates) if latency is not None]
+    count(len(passed), len(reachable) - len(passed), len(items) - len(reachable))
+    mark_dead([proxy for proxy, latency in results if latency is None])
+    if passed:
+        put_passed(passed)
+    logger.info('{} of {} proxies passed, {} unreachable'.format(len(passed), len(items),
+                                                                 len(items) - len(reachable)))
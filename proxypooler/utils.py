@@ -1,6 +1,12 @@
+import atexit
+import os
+import queue
 import ssl
+import threading
+import traceback
 
 import pika
+import pika.exceptions
 
 from proxypooler import config
 
@@ -15,60 +21,200 @@ class LoggerAsync:
         self.name = name
         self._logger = logger # celery task
 
+    def _log(self, lvl, msg, *args, **kwargs):
+        self._logger.delay(self.name, lvl, msg, *args, **kwargs)
+
     def debug(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'debug', msg, *args, **kwargs)
+        self._log('debug', msg, *args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'info', msg, *args, **kwargs)
+        self._log('info', msg, *args, **kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'warning', msg, *args, **kwargs)
+        self._log('warning', msg, *args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'error', msg, *args, **kwargs)
+        self._log('error', msg, *args, **kwargs)
 
     def exception(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'critical', msg, *args, **kwargs)
+        self._log('critical', msg, *args, **kwargs)
 
     def critical(self, msg, *args, **kwargs):
-        self._logger.delay(self.name, 'critical', msg, *args, **kwargs)
+        self._log('critical', msg, *args, **kwargs)
+
+
+class LogBuffer:
+    """Queue of log records written in batches by a background thread.
+
+    The thread was started on the first record of every process, so it works after
+    fork. When the queue was full, records were dropped and counted instead of
+    blocking the caller.
+
+    Attributes:
+        dropped: the number of dropped records.
+    """
+
+    def __init__(self, write, batch=config.log_batch, size=config.log_queue_size):
+        self._write = write # like task_logger.write
+        self.batch = batch
+        self._queue = queue.Queue(size)
+        self._pid = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        atexit.register(self.flush)
+
+    def put(self, record):
+        """Queue record like (name, lvl, msg, args, kwargs)."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, daemon=True).start()
+
+    def _take(self, block):
+        records = []
+        try:
+            if block:
+                records.append(self._queue.get())
+            while len(records) < self.batch:
+                records.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return records
+
+    def _write_all(self, records):
+        for name, lvl, msg, args, kwargs in records:
+            try:
+                self._write(name, lvl, msg, *args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+
+    def _run(self):
+        while 1:
+            self._write_all(self._take(block=True))
+
+    def flush(self):
+        """Write all queued records in the calling thread."""
+        while 1:
+            records = self._take(block=False)
+            if not records:
+                break
+            self._write_all(records)
+
+
+class LoggerBuffered(LoggerAsync):
+    """Logger writing records through a LogBuffer in the same process, no celery needed."""
+
+    def __init__(self, name, buffer):
+        self.name = name
+        self._buffer = buffer
+
+    def _log(self, lvl, msg, *args, **kwargs):
+        self._buffer.put((self.name, lvl, msg, args, kwargs))
 
 
 class MQueue:
     """ RabbitMQ's publisher/subscriber.
 
+    Publisher kept one channel in transaction mode, messages were buffered and
+    committed together when 'batch' messages were waiting or 'flush' seconds after
+    the first one, so one round trip was paid for a batch instead of a channel
+    handshake per message. The connection was reopened if it dropped, and the
+    uncommitted batch was published again.
+
     Attributes:
         exchange: exchange name.
         qname: queue name.
     """
 
-    def __init__(self, type_, url, exchange, qname):
-        parameters = pika.URLParameters(url)
-        self._connection = pika.BlockingConnection(parameters)
+    def __init__(self, type_, url, exchange, qname, batch=config.mq_batch, flush=config.mq_flush):
+        self._parameters = pika.URLParameters(url)
+        self._connection = pika.BlockingConnection(self._parameters)
         self.exchange = exchange
         self.qname = qname
+        self.batch = batch
+        self.flush_interval = flush
+        self._pub_channel = None
+        self._pending = [] # [(msg, routing_key), ...]
+        self._timer = None
+        self._lock = threading.RLock()
         if type_ == 'sub':
             self.channel = self._connection.channel()
             self.channel.exchange_declare(exchange=self.exchange,
                                           type='topic')
 
             self.channel.queue_declare(queue=self.qname, durable=True)
-
-    def put(self, msg, routing_key):
-        """Publish one message."""
-        channel = self._connection.channel()
-        channel.exchange_declare(exchange=self.exchange,
-                                 type='topic')
-        try:
+        else:
+            atexit.register(self.flush)
+
+    def _channel(self):
+        """The publisher's channel, reconnect if closed."""
+        if self._pub_channel is None or not self._pub_channel.is_open:
+            if not self._connection.is_open:
+                self._connection = pika.BlockingConnection(self._parameters)
+            channel = self._connection.channel()
+            channel.exchange_declare(exchange=self.exchange,
+                                     type='topic')
+            channel.tx_select()
+            self._pub_channel = channel
+        return self._pub_channel
+
+    def _publish(self, items):
+        channel = self._channel()
+        for msg, routing_key in items:
             channel.basic_publish(exchange=self.exchange,
                                   routing_key=routing_key,
                                   body=msg,
                                   properties=pika.BasicProperties(
                                       delivery_mode=2,  # make message persistent
                                   ))
-        except:
-            print('error')
-        channel.close()
+        channel.tx_commit()
+
+    def put(self, msg, routing_key):
+        """Publish one message, it was sent with the following ones in a batch."""
+        with self._lock:
+            self._pending.append((msg, routing_key))
+            if len(self._pending) >= self.batch:
+                self.flush()
+            else:
+                self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Publish all buffered messages, retry once on a new connection."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            items, self._pending = self._pending, []
+            if not items:
+                return
+            try:
+                self._publish(items)
+            except pika.exceptions.AMQPError:
+                self._pub_channel = None
+                try:
+                    self._connection.close()
+                except pika.exceptions.AMQPError:
+                    pass
+                try:
+                    self._publish(items)
+                except pika.exceptions.AMQPError:
+                    self._pending = items + self._pending # kept for the next flush
+                    self._schedule()
+                    traceback.print_exc()
 
     def start(self, binding_key, callback):
         """Start subscriber."""
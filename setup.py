@@ -11,6 +11,6 @@ setup(name='proxypooler',
     license='Apache License 2.0',
     keywords='celery proxy',
     packages=['proxypooler'],
-    install_requires=['aiohttp', 'celery', 'eventlet', 'msgpack-python',
+    install_requires=['aioamqp', 'aiohttp', 'aioredis<2', 'celery', 'eventlet', 'msgpack-python',
                       'pika', 'PyYAML', 'redis', 'requests']
 )
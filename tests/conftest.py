@@ -38,3 +38,15 @@ def celery_config():
 
         'result_expires' : 10
     }
+
+@pytest.fixture(params=['redis', 'memory'])
+def saver(request, conn):
+    from proxypooler.db import MemorySaver
+    if request.param == 'memory':
+        return MemorySaver()
+    return conn
+
+@pytest.fixture(scope='session')
+def aconn():
+    from proxypooler.db import AsyncRedisClient as arc
+    return arc('127.0.0.1', 6379)
@@ -0,0 +1,23 @@
+from proxypooler import codec
+from proxypooler.ext import compact_serial, member_deserial, serial
+
+
+def test_codec():
+    for proxy in ['127.0.0.1:80', '255.255.255.255:65535', '[::1]:8080', '[2001:db8::1]:3128']:
+        item = {'item': proxy, 'expire': 300}
+        data = codec.encode(item)
+        assert codec.is_compact(data)
+        assert codec.decode(data) == item
+    assert len(codec.encode({'item': '127.0.0.1:80', 'expire': 300})) == 12
+    assert len(codec.encode({'item': '[::1]:80', 'expire': 300})) == 24
+
+def test_codec_fallback():
+    for proxy, expire in [('proxy.example.com:80', 300), ('127.0.0.1:080', 300),
+                          ('127.0.0.1', 300), ('127.0.0.1:70000', 300), ('[::0:1]:80', 300),
+                          ('127.0.0.1:80', 1.5), ('127.0.0.1:80', -1), ('01.0.0.1:80', 300)]:
+        item = {'item': proxy, 'expire': expire}
+        assert codec.encode(item) is None
+        assert member_deserial(compact_serial(item)) == item
+
+    item = {'item': '127.0.0.1:80', 'expire': 300}
+    assert member_deserial(serial(item)) == item # MessagePack members still readable
@@ -1,5 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
 import pytest
 
+from proxypooler.db import MemorySaver, ShardedSaver, make_shards, unique_keys
 from proxypooler.errors import ProxyPoolerEmptyError
 
 def test_db(conn):
@@ -52,3 +56,234 @@ def test_db(conn):
 def test_db_empty(conn):
     with pytest.raises(ProxyPoolerEmptyError):
         conn.get()
+
+def test_db_pop_unique(conn):
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(1000)])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: conn.get_list(10), range(100)))
+
+    items = [item for result in results for item, _ in result]
+    assert len(items) == 1000
+    assert len(set(items)) == 1000
+    assert conn.size == 0
+
+def test_db_due(conn):
+    assert conn.next_due() is None
+    assert conn.get_due(100, 10) == []
+
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(10)])
+    assert conn.next_due() == 0
+    items = conn.get_due(5, 3)
+    assert [item.decode('utf-8') for item, _ in items] == ['127.0.0.1:0', '127.0.0.1:1', '127.0.0.1:2']
+    items = conn.get_due(5, 10)
+    assert [expire for _, expire in items] == [3, 4, 5]
+    assert conn.get_due(5, 10) == []
+    assert conn.next_due() == 6
+    assert conn.size == 4
+    conn.get_list(10)
+
+def test_memory_saver_due():
+    conn = MemorySaver()
+    assert conn.next_due() is None
+    conn.put_list([(b'127.0.0.1:80', 3), (b'127.0.0.1:81', 1), (b'127.0.0.1:82', 2)])
+    conn.put(b'127.0.0.1:81', 4)
+    assert conn.next_due() == 2
+    assert conn.get_due(3, 10) == [(b'127.0.0.1:82', 2), (b'127.0.0.1:80', 3)]
+    assert conn.next_due() == 4
+    assert conn.size == 1
+
+def test_db_peek(conn):
+    assert conn.peek_list(3) == []
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(10)])
+
+    items = conn.peek_list(3)
+    assert [expire for _, expire in items] == [9, 8, 7]
+    items = conn.peek_list(3, offset=4, window=5)
+    assert [expire for _, expire in items] == [5, 9, 8]
+    items = conn.peek_list(8, offset=1, window=5)
+    assert [expire for _, expire in items] == [8, 7, 6, 5, 9]
+    assert conn.size == 10
+    conn.get_list(10)
+
+def test_memory_saver_peek():
+    conn = MemorySaver()
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(10)])
+    items = conn.peek_list(3, offset=4, window=5)
+    assert [expire for _, expire in items] == [5, 9, 8]
+    items = conn.peek_list(3, offset=9, window=0)
+    assert [expire for _, expire in items] == [0, 9, 8]
+    assert [expire for _, expire in conn.peek_newer(6, 2)] == [9, 8]
+    assert conn.peek_newer(9, 2) == []
+    assert conn.size == 10
+
+def test_db_peek_newer(conn):
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(10)])
+    items = conn.peek_newer(6, 5)
+    assert [(item.decode('utf-8'), expire) for item, expire in items] == [
+        ('127.0.0.1:9', 9), ('127.0.0.1:8', 8), ('127.0.0.1:7', 7)]
+    assert conn.peek_newer(9, 1) == []
+    assert conn.size == 10
+    conn.get_list(10)
+
+def test_db_replace(conn):
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(3)])
+    assert conn.replace_list([(b'127.0.0.1:1', b'a'), (b'127.0.0.1:5', b'b')]) == 1
+    assert sorted(conn.scan()) == [(b'127.0.0.1:0', 0), (b'127.0.0.1:2', 2), (b'a', 1)]
+    assert conn.replace_list([]) == 0
+    conn.get_list(10)
+
+def test_memory_saver_replace():
+    conn = MemorySaver()
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(3)])
+    assert conn.replace_list([('127.0.0.1:1', 'a'), ('127.0.0.1:5', 'b')]) == 1
+    assert conn.get_list(3) == [('127.0.0.1:0', 0), ('a', 1), ('127.0.0.1:2', 2)]
+
+def check_put_unique(conn):
+    ids = lambda items: [(item[:-1], int(item[-1:])) for item, _ in items] # like b'a1' -> (b'a', 1)
+    assert conn.put_unique([(b'a5', 10), (b'b5', 20)], ids([(b'a5', 0), (b'b5', 0)]), 'earliest') == 0
+    assert conn.put_unique([(b'a3', 15), (b'b3', 5)], ids([(b'a3', 0), (b'b3', 0)]), 'earliest') == 2
+    assert sorted(conn.scan()) == [(b'a5', 10), (b'b3', 5)]
+    assert conn.put_unique([(b'a3', 15), (b'b9', 1)], ids([(b'a3', 0), (b'b9', 0)]), 'shortest') == 2
+    assert sorted(conn.scan()) == [(b'a3', 15), (b'b3', 5)]
+    assert conn.put_unique([(b'a9', 30)], ids([(b'a9', 0)]), 'latest') == 1
+    assert sorted(conn.scan()) == [(b'a9', 30), (b'b3', 5)]
+    assert conn.stats() == {'size': 2, 'duplicates': 5}
+
+    assert conn.lease_list(1, 100) == [(b'a9', 30)]
+    assert conn.put_unique([(b'a1', 1)], ids([(b'a1', 0)]), 'latest') == 1 # leased one was kept
+    assert conn.get_list(2) == [(b'b3', 5)]
+    assert conn.prune_ids() == 1
+    assert conn.put_unique([(b'b1', 1)], ids([(b'b1', 0)]), 'earliest') == 0
+    assert conn.release_list([b'a9']) == [(b'a9', 30)]
+    assert conn.get_list(2) == [(b'b1', 1), (b'a9', 30)]
+    assert conn.prune_ids() == 2
+
+def test_db_put_unique(conn):
+    try:
+        check_put_unique(conn)
+    finally:
+        conn._db.delete('pp:ids', 'pp:stats')
+
+def test_memory_saver_put_unique():
+    check_put_unique(MemorySaver())
+
+def test_sharded_saver_put_unique():
+    shards = make_shards(3, ['127.0.0.1:6379'], name='pp_test')
+    try:
+        check_put_unique(ShardedSaver(shards, identity=lambda item: item[:-1]))
+    finally:
+        for shard in shards:
+            shard._db.delete(*unique_keys(shard.name))
+
+def test_db_lease(conn):
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(5)])
+
+    items = conn.lease_list(2, 100)
+    assert [(item.decode('utf-8'), expire) for item, expire in items] == [
+        ('127.0.0.1:4', 4), ('127.0.0.1:3', 3)]
+    assert conn.size == 3
+    assert conn.lease_list(1, 200)[0][0] == b'127.0.0.1:2'
+
+    assert conn.release_list([b'127.0.0.1:4', b'127.0.0.1:0']) == [(b'127.0.0.1:4', 4)]
+    assert conn.size == 3
+    assert conn.reclaim(99) == []
+    assert conn.reclaim(100) == [(b'127.0.0.1:3', 3)]
+    assert conn.size == 4
+    assert conn.release_list([b'127.0.0.1:3']) == []
+    assert conn.reclaim(200) == [(b'127.0.0.1:2', 2)]
+    assert [expire for _, expire in conn.get_list(10)] == [0, 1, 2, 3, 4]
+
+def test_memory_saver_lease():
+    conn = MemorySaver()
+    conn.put_list([(b'127.0.0.1:80', 1), (b'127.0.0.1:81', 2)])
+    assert conn.lease_list(5, 100) == [(b'127.0.0.1:81', 2), (b'127.0.0.1:80', 1)]
+    assert conn.size == 0
+    assert conn.release_list([b'127.0.0.1:81', b'127.0.0.1:82']) == [(b'127.0.0.1:81', 2)]
+    assert conn.reclaim(99) == []
+    assert conn.reclaim(100) == [(b'127.0.0.1:80', 1)]
+    assert conn.get_list(5) == [(b'127.0.0.1:80', 1), (b'127.0.0.1:81', 2)]
+
+def test_memory_saver(tmpdir):
+    snapshot = str(tmpdir.join('snapshot'))
+    conn = MemorySaver(snapshot, snapshot_interval=3600)
+    conn.put(b'127.0.0.1:80', 15)
+    conn.put(b'127.0.0.1:81', 14)
+    conn.put_list([(b'127.0.0.1:82', 210), (b'127.0.0.1:83', 2), (b'127.0.0.1:84', 100)])
+
+    assert conn.size == 5
+    assert conn.get() == (b'127.0.0.1:83', 2)
+    assert conn.get_list(2, rev=True) == [(b'127.0.0.1:82', 210), (b'127.0.0.1:84', 100)]
+    assert conn.size == 2
+
+    conn.put(b'127.0.0.1:81', 20) # update expire
+    assert conn.size == 2
+    conn.snapshot()
+
+    assert conn.get_list(30) == [(b'127.0.0.1:80', 15), (b'127.0.0.1:81', 20)]
+    assert conn.size == 0
+    with pytest.raises(ProxyPoolerEmptyError):
+        conn.get()
+    assert conn.get_list(1, rev=True) == []
+
+    conn = MemorySaver(snapshot)
+    assert conn.size == 2
+    assert conn.get(rev=True) == (b'127.0.0.1:81', 20)
+
+def test_memory_saver_snapshot_once(tmpdir):
+    conn = MemorySaver(str(tmpdir.join('snapshot')), snapshot_interval=3600)
+    conn.put_list([('127.0.0.1:{}'.format(i), i) for i in range(1000)])
+    dumps = []
+    snapshot = conn.snapshot
+    conn.snapshot = lambda: (dumps.append(1), sleep(0.05), snapshot())
+    conn._snapshot_at = 0 # due
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: conn.get_list(1), range(8)))
+    assert dumps == [1] # claimed by the first thread, the others did not dump
+    assert MemorySaver(str(tmpdir.join('snapshot'))).size >= 992
+
+def test_memory_saver_compact():
+    conn = MemorySaver()
+    for i in range(10000):
+        conn.put(b'127.0.0.1:80', i)
+    assert conn.size == 1
+    assert len(conn._min) < 10000
+    assert conn.get() == (b'127.0.0.1:80', 9999)
+
+def test_sharded_saver(conn):
+    shards = make_shards(3, ['127.0.0.1:6379'], name='pp_test')
+    for shard in shards:
+        shard._db.delete(shard.name)
+    saver = ShardedSaver(shards)
+    items = [('127.0.0.1:{}'.format(i), i) for i in range(30)]
+    saver.put_list(items)
+    conn.put_list(items)
+    assert saver.size == 30
+    assert all(shard.size for shard in shards)
+
+    for window, offset, count in [(0, 0, 3), (10, 8, 5), (40, 29, 3), (5, 0, 10)]:
+        assert saver.peek_list(count, offset, window) == conn.peek_list(count, offset, window)
+    assert saver.peek_newer(26, 5) == conn.peek_newer(26, 5)
+
+    assert saver.get_list(4, rev=True) == conn.get_list(4, rev=True)
+    assert saver.get_list(3) == conn.get_list(3)
+    assert saver.next_due() == 3
+    assert sorted(saver.get_due(5, 10)) == [(b'127.0.0.1:3', 3), (b'127.0.0.1:4', 4), (b'127.0.0.1:5', 5)]
+
+    claimed, later = saver.claim([b'127.0.0.1:6', b'127.0.0.1:20', b'127.0.0.1:1'], 10)
+    assert claimed == [(b'127.0.0.1:6', 6)]
+    assert later == [(b'127.0.0.1:20', 20)]
+    assert saver.lease_list(1, 100) == [(b'127.0.0.1:25', 25)]
+    assert saver.release_list([b'127.0.0.1:25']) == [(b'127.0.0.1:25', 25)]
+
+    assert saver.replace_list([(b'127.0.0.1:7', b'a'), (b'127.0.0.1:8', b'b'),
+                               (b'127.0.0.1:9', b'c')]) == 3
+    assert sorted(saver.scan())[-3:] == [(b'a', 7), (b'b', 8), (b'c', 9)]
+    assert saver.size == 30 - 7 - 3 - 1
+
+    saver = ShardedSaver(shards, validate=[0])
+    assert set(saver.scan()) == set(shards[0].scan())
+    for shard in shards:
+        shard._db.delete(shard.name)
+    conn.get_list(30)
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from proxypooler.db import MemorySaver
+from proxypooler.engine import ValidateEngine, proxy_url
+from proxypooler.pooler import ProxyPooler
+
+
+def test_proxy_url():
+    assert proxy_url('127.0.0.1:80') == 'http://127.0.0.1:80'
+    assert proxy_url('https://127.0.0.1:80') == 'https://127.0.0.1:80'
+
+def test_engine(saver):
+    p = ProxyPooler(saver=saver, engine=True)
+    assert isinstance(p.engine, ValidateEngine)
+
+    async def validate(proxy):
+        await asyncio.sleep(0)
+        return 0.1 if proxy.endswith('0') else None
+    p.engine.validate = validate
+
+    async def probe(proxy):
+        return not proxy.endswith('5')
+    p.engine.probe = probe
+
+    loop = asyncio.get_event_loop()
+    p.engine.concurrency = 4
+    p.engine.backlog = 5 # room for all 20
+    p.engine.start(loop)
+    p._dispatch([({'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}, 0) for i in range(20)])
+
+    async def _wait():
+        while p.engine.passed + p.engine.failed < 20:
+            await asyncio.sleep(0.01)
+        await p.engine.flush()
+    loop.run_until_complete(_wait())
+
+    assert (p.engine.passed, p.engine.failed, p.engine.unreachable) == (2, 18, 2)
+    items = p.get_list(10)
+    assert sorted(items) == [('127.0.0.1:80', 10), ('127.0.0.1:90', 10)]
+    assert sorted(p.fast_list(5)) == [('127.0.0.1:80', 0.1), ('127.0.0.1:90', 0.1)]
+    p.index.prune_health(float('inf'))
+
+    p.put_list([('127.0.0.1:81', 10), ('127.0.0.1:82', 10)]) # failed just now
+    assert p.rejected == 2
+    p.saver.mark_dead([], 0, -1, 0) # forget all
+
+def test_engine_errors():
+    p = ProxyPooler(saver=MemorySaver(), engine=True)
+
+    async def validate(proxy):
+        if proxy.endswith('1'):
+            raise ValueError(proxy)
+        return 0.1
+    p.engine.validate = validate
+
+    async def probe(proxy):
+        return True
+    p.engine.probe = probe
+
+    loop = asyncio.get_event_loop()
+    p.engine.concurrency = 1
+    p.engine.backlog = 3
+    p.engine.start(loop)
+    p._dispatch([({'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}, 0) for i in range(3)])
+
+    async def _wait():
+        while p.engine.passed + p.engine.failed < 3:
+            await asyncio.sleep(0.01)
+        await p.engine.flush()
+    loop.run_until_complete(_wait())
+
+    assert (p.engine.passed, p.engine.failed) == (2, 1) # the worker survived '127.0.0.1:81'
+    assert sorted(p.get_list(5)) == [('127.0.0.1:80', 10), ('127.0.0.1:82', 10)]
+
+@pytest.mark.parametrize('wheel', [False, True])
+def test_engine_backlog(wheel):
+    p = ProxyPooler(saver=MemorySaver(), engine=True, wheel=wheel)
+    p.engine.concurrency = 2
+    p.engine.backlog = 2
+    p.engine.start(asyncio.new_event_loop()) # not running, nothing was taken by workers
+    p.put_list([('127.0.0.1:{}'.format(80+i), -10) for i in range(10)])
+
+    p._get_validates()
+    assert p.engine.room() == 0
+    assert p.size == 6 # the rest waited in saver
+    p._get_validates()
+    assert p.size == 6
+    if wheel:
+        assert len(p.scheduler.wheel) == 6 # due again when the engine had room
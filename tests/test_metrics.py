@@ -0,0 +1,97 @@
+import asyncio
+from unittest.mock import Mock
+
+from proxypooler import metrics, task_validator
+from proxypooler.db import MemorySaver, unique_keys
+from proxypooler.metrics import Counter, Gauge, Histogram, render
+from proxypooler.pooler import ProxyPooler
+
+
+def test_render():
+    registry = []
+    served = Counter('served_total', 'Served.', ['cmd'], registry=registry)
+    size = Gauge('size', 'Size.', registry=registry)
+    seconds = Histogram('seconds', 'Seconds.', ['op'], buckets=(0.1, 1), registry=registry)
+
+    served.inc(3, cmd='get')
+    served.inc(cmd='get')
+    served.inc(cmd='pe"ek')
+    size.set(7)
+    seconds.observe(0.05, op='put')
+    seconds.observe(0.5, op='put')
+    seconds.observe(5, op='put')
+
+    assert render(registry) == '\n'.join([
+        '# HELP served_total Served.',
+        '# TYPE served_total counter',
+        'served_total{cmd="get"} 4',
+        'served_total{cmd="pe\\"ek"} 1',
+        '# HELP size Size.',
+        '# TYPE size gauge',
+        'size 7',
+        '# HELP seconds Seconds.',
+        '# TYPE seconds histogram',
+        'seconds_bucket{op="put",le="0.1"} 1',
+        'seconds_bucket{op="put",le="1.0"} 2',
+        'seconds_bucket{op="put",le="+Inf"} 3',
+        'seconds_sum{op="put"} 5.55',
+        'seconds_count{op="put"} 3',
+    ]) + '\n'
+
+def test_metrics_handler():
+    p = ProxyPooler(saver=MemorySaver())
+    p.put_list([('127.0.0.1:80', 10), ('127.0.0.1:81', 10)])
+    p.get_list(1)
+
+    request = Mock()
+    request.app = {'websockets': [object()]}
+    loop = asyncio.get_event_loop()
+    text = loop.run_until_complete(p.metrics_handler(request)).text
+    assert 'proxypooler_pool_size 1\n' in text
+    assert 'proxypooler_websockets 1\n' in text
+    assert 'proxypooler_saver_seconds_count{op="get"}' in text
+    assert 'proxypooler_saver_seconds_count{op="put"}' in text
+
+def test_validated_counts():
+    p = ProxyPooler(saver=MemorySaver(), engine=True)
+
+    async def probe(proxy):
+        return False
+    p.engine.probe = probe
+
+    before = dict(metrics.validated._values)
+    loop = asyncio.get_event_loop()
+    p.engine.start(loop)
+    p._dispatch([({'item': '127.0.0.1:80', 'expire': 10}, 0)])
+
+    async def _wait():
+        while p.engine.failed < 1:
+            await asyncio.sleep(0.01)
+        await p.engine.flush()
+    loop.run_until_complete(_wait())
+
+    counts = {result: metrics.validated._values.get((result,), 0) - before.get((result,), 0)
+              for result in ('passed', 'failed', 'unreachable')}
+    assert counts == {'passed': 0, 'failed': 0, 'unreachable': 1}
+
+def test_celery_validated(conn, monkeypatch):
+    monkeypatch.setattr(task_validator, 'probe', lambda proxy: not proxy.endswith('2'))
+    monkeypatch.setattr(task_validator, 'check', lambda proxy: 0.5 if proxy.endswith('0') else None)
+    monkeypatch.setattr(task_validator, 'record', lambda results: [None] * len(results))
+    monkeypatch.setattr(task_validator, 'mark_dead', lambda proxies: None)
+    monkeypatch.setattr(task_validator, 'put_passed', lambda items: None)
+    p = ProxyPooler(saver=conn)
+    try:
+        task_validator.validate_batch([{'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}
+                                       for i in range(3)])
+        task_validator.validate({'item': '127.0.0.1:92', 'expire': 10})
+        assert conn.validated() == {'passed': 1, 'failed': 1, 'unreachable': 2}
+
+        request = Mock()
+        request.app = {}
+        loop = asyncio.get_event_loop()
+        text = loop.run_until_complete(p.metrics_handler(request)).text
+        assert '# TYPE proxypooler_celery_validated_total counter\n' in text
+        assert 'proxypooler_celery_validated_total{result="unreachable"} 2\n' in text
+    finally:
+        conn._db.delete(unique_keys(conn.name)[3])
@@ -0,0 +1,41 @@
+import pytest
+
+from proxypooler.ext import serial
+from proxypooler.middlewares import (deserialize, fuse, pack, put_in, serialize,
+                                     unpack, update_expire)
+
+
+def run(calls, item, expire):
+    for call in calls:
+        item, expire = call(item, expire)
+    return item, expire
+
+def test_fuse():
+    calls = fuse([pack, serialize, update_expire, put_in])
+    assert len(calls) == 2
+    assert calls[1] is put_in
+    assert fuse([serialize, put_in]) == [serialize, put_in]
+
+    def custom(item, expire):
+        return item, expire
+    assert fuse([deserialize, custom, unpack]) == [deserialize, custom, unpack]
+    assert fuse([pack, serialize]) is not fuse([pack, serialize]) # new list
+    assert fuse([pack, serialize])[0] is fuse([pack, serialize])[0] # compiled once
+
+def test_fused_put():
+    calls = [pack, serialize, update_expire]
+    fused = fuse(calls)
+    items = [('127.0.0.1:{}'.format(80+i), i) for i in range(5)]
+    assert run(fused, items, None) == run(calls, items, None)
+    assert run(fused, tuple(items), None) == run(calls, tuple(items), None)
+    assert run(fused, '127.0.0.1:80', 10) == run(calls, '127.0.0.1:80', 10)
+    with pytest.raises(TypeError):
+        run(fused, '127.0.0.1:80', None)
+
+def test_fused_get():
+    calls = [deserialize, unpack]
+    fused = fuse(calls)
+    items = [(serial({'item': '127.0.0.1:{}'.format(80+i), 'expire': i}), 100+i) for i in range(5)]
+    assert run(fused, items, None) == run(calls, items, None)
+    assert run(fused, items, None)[0][0] == ('127.0.0.1:80', 0)
+    assert run(fused, items[0][0], 100) == ('127.0.0.1:80', 0)
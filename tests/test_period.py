@@ -0,0 +1,32 @@
+from proxypooler import task_validator
+from proxypooler.ext import deserial
+from proxypooler.period import AdaptivePeriod, FixedPeriod, get_policy, next_periods
+
+
+def test_fixed():
+    assert isinstance(get_policy('fixed'), FixedPeriod)
+    assert FixedPeriod().next_period(10, 0.1) == 10
+
+def test_adaptive():
+    policy = AdaptivePeriod(stretch=2, shrink=0.5, shortest=10, longest=100, good_rate=0.9)
+    assert policy.next_period(30, None) == 60
+    assert policy.next_period(60, 0.95) == 100
+    assert policy.next_period(200, 1) == 200 # longer than longest when put
+    assert policy.next_period(30, 0.5) == 15
+    assert policy.next_period(15, 0.5) == 10
+    assert policy.next_period(5, 0.5) == 5
+    assert next_periods(policy, [('a', 30), ('b', 30)], [1, 0.1]) == [('a', 60), ('b', 15)]
+
+def test_validate_adaptive(monkeypatch):
+    published = []
+    monkeypatch.setattr(task_validator, 'policy', AdaptivePeriod(2, 0.5, 10, 100, 0.9))
+    monkeypatch.setattr(task_validator, 'mark_dead', lambda proxies: None)
+    monkeypatch.setattr(task_validator, 'check', lambda proxy: 0.5 if proxy.endswith('1') else None)
+    monkeypatch.setattr(task_validator, 'probe', lambda proxy: True)
+    monkeypatch.setattr(task_validator, 'record', lambda results: [0.5 if proxy == '127.0.0.1:91' else 1
+                                                                  for proxy, _ in results])
+    monkeypatch.setattr(task_validator.validator_pub_queue, 'put',
+                        lambda msg, key: published.append(deserial(msg)))
+    task_validator.validate_batch([{'item': '127.0.0.1:{}'.format(80+i), 'expire': 40}
+                                   for i in range(20)])
+    assert published == [(('127.0.0.1:81', 80), ('127.0.0.1:91', 20))]
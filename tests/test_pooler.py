@@ -4,7 +4,7 @@ import signal
 import ssl
 from multiprocessing import Process
 from random import randint
-from time import sleep
+from time import sleep, time
 from unittest.mock import Mock
 
 import aiohttp
@@ -12,9 +12,12 @@ import pytest
 import requests
 
 from proxypooler import config
-from proxypooler.pooler import ProxyPooler
+from proxypooler.db import MemorySaver, ShardedSaver, make_shards, unique_keys
+from proxypooler import pooler as pooler_module
+from proxypooler.pooler import ProxyPooler, migrate
+from proxypooler import task_validator
 
-from proxypooler.ext import serial, deserial
+from proxypooler.ext import compact_serial, member_proxy, serial, deserial
 
 srv = pytest.mark.skipif(
     not pytest.config.getoption("--runsrv"),
@@ -102,8 +105,8 @@ def proxy(pooler):
     return p, proc, count
 
 
-def test_api(conn):
-    p = ProxyPooler(saver=conn)
+def test_api(saver):
+    p = ProxyPooler(saver=saver)
     for i in range(10):
         p.put('127.0.0.1:{}'.format(80+i), i+2)
 
@@ -175,6 +178,290 @@ def test_api(conn):
     items, _ = p._get_items(1)
     assert not items
 
+def test_sharded(monkeypatch):
+    sent = []
+    monkeypatch.setattr(task_validator.validate_batch, 'delay', sent.extend)
+    p = ProxyPooler(saver=ShardedSaver(make_shards(3, ['127.0.0.1:6379'], name='pp_test')))
+    p.put_list([('127.0.0.1:{}'.format(80+i), i+2) for i in range(10)])
+    assert p.size == 10
+
+    assert p.peek_list(2) == [('127.0.0.1:89', 11), ('127.0.0.1:88', 10)]
+    assert p.get_list(3, rev=True) == [('127.0.0.1:89', 11), ('127.0.0.1:88', 10),
+                                       ('127.0.0.1:87', 9)]
+    assert p.get_list(2) == [('127.0.0.1:80', 2), ('127.0.0.1:81', 3)]
+    assert p.lease_list(1, 60) == [('127.0.0.1:86', 8)]
+    assert p.release_list(['127.0.0.1:86']) == 1
+
+    p.put_list([('127.0.0.1:{}'.format(280+i), 0) for i in range(150)])
+    p._get_validates()
+    assert len(sent) == 150
+    assert p.size == 5
+    p.get_list(5)
+
+def test_sharded_identity(monkeypatch):
+    monkeypatch.setattr(config, 'dedupe', 'shortest')
+    monkeypatch.setattr(config, 'validate_reinsert', 'direct')
+    monkeypatch.setattr(task_validator, 'check', lambda proxy: 0.5)
+    monkeypatch.setattr(task_validator, 'probe', lambda proxy: True)
+    monkeypatch.setattr(task_validator, 'mark_dead', lambda proxies: None)
+    monkeypatch.setattr(task_validator, 'record', lambda results: [None] * len(results))
+    shards = make_shards(3, ['127.0.0.1:6379'], name='pp_test')
+    saver = ShardedSaver(shards, identity=member_proxy)
+    monkeypatch.setattr(task_validator, 'saver', saver)
+    p = ProxyPooler(saver=saver)
+    try:
+        p.put_list([('127.0.0.1:{}'.format(80+i), 20) for i in range(10)])
+        task_validator.validate_batch([{'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}
+                                       for i in range(10)]) # passed into the same shards
+        assert p.stats() == {'size': 10, 'duplicates': 10}
+        assert sorted(p.get_list(10)) == [('127.0.0.1:{}'.format(80+i), 10) for i in range(10)]
+    finally:
+        for shard in shards:
+            shard._db.delete(*unique_keys(shard.name))
+
+def test_peek(saver):
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:{}'.format(80+i), i+2) for i in range(10)])
+
+    items = p.peek_list(3)
+    assert items == [('127.0.0.1:89', 11), ('127.0.0.1:88', 10), ('127.0.0.1:87', 9)]
+    items = p.peek_list(3) # the following ones
+    assert items[0] == ('127.0.0.1:86', 8)
+    assert p.size == 10
+    assert not p.peek_list(0)
+    p.get_list(10)
+
+def test_peek_cache(saver):
+    async def _test():
+        p = ProxyPooler(saver=saver)
+        p.put_list([('127.0.0.1:{}'.format(80+i), i+2) for i in range(3)])
+
+        n, data = await p.peek_bytes_async(2)
+        assert n == 2
+        assert deserial(data) == (('127.0.0.1:82', 4), ('127.0.0.1:81', 3))
+        assert p.cache.misses == 1
+
+        p.put_list([('127.0.0.1:90', 20)])
+        n, data = await p.peek_bytes_async(2) # not refreshed yet
+        assert deserial(data) == (('127.0.0.1:80', 2), ('127.0.0.1:82', 4))
+        assert p.cache.hits == 1
+
+        p.cache.refreshed_at = 0
+        n, data = await p.peek_bytes_async(4)
+        assert n == 4
+        assert ('127.0.0.1:90', 20) in deserial(data)
+        assert p.size == 4
+        p.get_list(4)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_test())
+
+def test_migrate(saver, monkeypatch):
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:{}'.format(80+i), i+2) for i in range(5)] + [('localhost:80', 10)])
+    expires = sorted(expire for _, expire in saver.scan())
+
+    monkeypatch.setattr(pooler_module, 'member_serial', compact_serial)
+    assert migrate(saver, chunk_size=2) == 5 # hostname was kept in MessagePack
+    assert migrate(saver) == 0
+    assert sorted(expire for _, expire in saver.scan()) == expires
+    assert sum(item[:1] == b'\xc1' for item, _ in saver.scan()) == 5
+
+    items = p.get_list(10)
+    assert items[0] == ('127.0.0.1:80', 2)
+    assert items[-1] == ('localhost:80', 10)
+
+def test_dedupe(saver, monkeypatch):
+    monkeypatch.setattr(config, 'dedupe', 'shortest')
+    p = ProxyPooler(saver=saver)
+    try:
+        p.put_list([('127.0.0.1:80', 20), ('127.0.0.1:81', 5)])
+        p.put_list([('127.0.0.1:80', 10), ('127.0.0.1:81', 30)]) # resubmitted
+        p.put('127.0.0.1:80', 15)
+        assert p.stats() == {'size': 2, 'duplicates': 3}
+        assert sorted(p.peek_list(5)) == [('127.0.0.1:80', 10), ('127.0.0.1:81', 5)]
+        p.get_list(5)
+
+        p._ids_pruned_at = 0
+        p._get_validates()
+        p.put('127.0.0.1:80', 60)
+        assert p.stats() == {'size': 1, 'duplicates': 3}
+        p.get_list(5)
+    finally:
+        if hasattr(saver, '_db'):
+            saver._db.delete('pp:ids', 'pp:stats')
+
+def test_fast(saver):
+    p = ProxyPooler(saver=saver, engine=True) # recorded into saver
+    p.record([('127.0.0.1:80', 0.5), ('127.0.0.1:81', 0.2), ('127.0.0.1:82', None)], 100)
+    assert p.fast_list(5) == [('127.0.0.1:81', 0.2), ('127.0.0.1:80', 0.5)]
+    assert p.record([('127.0.0.1:81', None), ('127.0.0.1:80', 1.5)], 200)[0] == 0.7
+    assert p.record([('127.0.0.1:83', None)], 200) == [None]
+    assert p.fast_list(5) == [('127.0.0.1:80', 0.8)]
+    assert [round(rate, 2) for rate in p.record([('127.0.0.1:81', 0.2)], 300)] == [0.79]
+    assert p.fast_list(1) == [('127.0.0.1:81', 0.253)] # 0.2 / success rate 0.79
+
+    assert p.index.prune_health(250) == 1
+    assert p.fast_list(5) == [('127.0.0.1:81', 0.253)]
+    assert p.index.prune_health(1000) == 1
+
+def test_dead(saver, monkeypatch):
+    monkeypatch.setattr(config, 'dead_size', 3)
+    p = ProxyPooler(saver=saver) # marked in saver, validated by engine or not
+    p.mark_dead(['127.0.0.1:80', '127.0.0.1:81'])
+    p.put_list([('127.0.0.1:{}'.format(80+i), 10) for i in range(3)])
+    p.put('127.0.0.1:80', 10)
+    assert p.rejected == 3
+    assert p.get_list(5) == [('127.0.0.1:82', 10)]
+
+    p.mark_dead(['127.0.0.1:82', '127.0.0.1:83'])  # 127.0.0.1:80 was forgotten for size
+    assert p._reject_dead([('127.0.0.1:80', 10), ('127.0.0.1:83', 10)]) == [('127.0.0.1:80', 10)]
+    p.put_passed([('127.0.0.1:83', 20)]) # another copy of it passed, not rejected
+    assert p.get_list(5) == [('127.0.0.1:83', 20)]
+    monkeypatch.setattr(config, 'dead_ttl', 0)
+    p.put('127.0.0.1:83', 10)
+    assert p.get_list(5) == [('127.0.0.1:83', 10)]
+    saver.mark_dead([], time(), -1, 0) # forget all
+    assert saver.is_dead(['127.0.0.1:82', '127.0.0.1:83'], 0) == [False, False]
+
+def test_dead_fail_open(monkeypatch):
+    saver = MemorySaver()
+    saver.is_dead = Mock(side_effect=ConnectionError)
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:80', 10)])
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(p._reject_dead_async([('127.0.0.1:81', 10)])) == [
+        ('127.0.0.1:81', 10)]
+    assert p.get_list(5) == [('127.0.0.1:80', 10)]
+    assert p.rejected == 0
+
+def test_lease(saver):
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:{}'.format(80+i), i+2) for i in range(10)])
+
+    items = p.lease_list(3, 60)
+    assert items == [('127.0.0.1:89', 11), ('127.0.0.1:88', 10), ('127.0.0.1:87', 9)]
+    assert p.size == 7
+    assert p.lease_list(2, 60)[0] == ('127.0.0.1:86', 8) # not leased twice
+
+    assert p.size == 5
+
+    assert p.release_list(['127.0.0.1:89', '127.0.0.1:80']) == 1
+    assert p.size == 6
+    assert p.release_list(['127.0.0.1:89']) == 0
+
+    p.lease_list(1, 0) # lapsed at once
+    assert p.size == 5
+    p._reclaim_leases()
+    assert p.size == 6
+    p.release_list(['127.0.0.1:88', '127.0.0.1:87', '127.0.0.1:86', '127.0.0.1:85'])
+    assert p.size == 10
+    p.get_list(10)
+
+def test_validates(saver, monkeypatch):
+    sent, batches = [], []
+    monkeypatch.setattr(task_validator.validate_batch, 'delay',
+                        lambda items: (batches.append(len(items)), sent.extend(items)))
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:{}'.format(80+i), 0) for i in range(150)])
+    p.put_list([('127.0.0.1:{}'.format(280+i), 100) for i in range(5)])
+
+    p._get_validates()
+    assert len(sent) == 150
+    assert batches == [50, 50, 50]
+    assert sent[0] == {'item': '127.0.0.1:80', 'expire': 0}
+    assert p.size == 5
+
+    p._get_validates() # nothing due
+    assert len(sent) == 150
+    assert p.size == 5
+
+    p.scheduler.max_wait = 0
+    p.scheduler.clear()
+    p.scheduler.wait(saver.next_due())
+    assert p.scheduler.next_due == saver.next_due()
+    p.put('127.0.0.1:1', 1000) # expire later
+    assert not p.scheduler._event.is_set()
+    p.put('127.0.0.1:2', 0)
+    assert p.scheduler._event.is_set()
+    p.get_list(10)
+
+def test_wheel_validates(saver, monkeypatch):
+    sent = []
+    monkeypatch.setattr(task_validator.validate_batch, 'delay', sent.extend)
+    p = ProxyPooler(saver=saver)
+    p.put_list([('127.0.0.1:{}'.format(80+i), 0) for i in range(150)]) # put by others
+
+    p = ProxyPooler(saver=saver, wheel=True)
+    p.put_list([('127.0.0.1:{}'.format(280+i), 100) for i in range(5)])
+    p._get_validates()
+    assert len(sent) == 150
+    assert len(p.scheduler.wheel) == 5
+    assert p.size == 5
+
+    p.put('127.0.0.1:1', 0)
+    p.get_list(1) # taken by others before validated
+    p._get_validates()
+    assert len(sent) == 150
+    assert p.size == 5
+    p.get_list(10)
+
+def test_validate_batch(monkeypatch):
+    published = []
+    dead = []
+    monkeypatch.setattr(task_validator, 'check', lambda proxy: 0.5 if proxy.endswith('1') else None)
+    monkeypatch.setattr(task_validator, 'probe', lambda proxy: True)
+    monkeypatch.setattr(task_validator, 'mark_dead', dead.extend)
+    monkeypatch.setattr(task_validator.validator_pub_queue, 'put',
+                        lambda msg, key: published.append(deserial(msg)))
+    task_validator.validate_batch([{'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}
+                                   for i in range(20)])
+    assert published == [(('127.0.0.1:81', 10), ('127.0.0.1:91', 10))]
+    assert len(dead) == 18 and '127.0.0.1:80' in dead
+
+def test_validate_direct(conn, monkeypatch):
+    monkeypatch.setattr(config, 'validate_reinsert', 'direct')
+    monkeypatch.setattr(task_validator, 'check', lambda proxy: 0.5 if proxy.endswith('1') else None)
+    monkeypatch.setattr(task_validator, 'probe', lambda proxy: True)
+    monkeypatch.setattr(task_validator, 'mark_dead', lambda proxies: None)
+    monkeypatch.setattr(task_validator, 'record', lambda results: [None] * len(results))
+    task_validator.validate_batch([{'item': '127.0.0.1:{}'.format(80+i), 'expire': 10}
+                                   for i in range(20)])
+    task_validator.validate({'item': '127.0.0.1:1', 'expire': 20})
+
+    p = ProxyPooler(saver=conn)
+    assert p.size == 3
+    assert conn.next_due() > time() + 5 # validate again after 'expire' seconds
+    assert sorted(p.get_list(3)) == [('127.0.0.1:1', 20), ('127.0.0.1:81', 10), ('127.0.0.1:91', 10)]
+
+def test_api_async(conn, aconn):
+    async def _test():
+        p = ProxyPooler(saver=aconn)
+        assert p.saver_async
+
+        await p.put_list_async([('127.0.0.1:{}'.format(80+i), i+2) for i in range(10)])
+        assert await p.size_async() == 10
+
+        items = await p.get_list_async(3, rev=True)
+        assert len(items) == 3
+        assert items[0] == ('127.0.0.1:89', 11)
+        assert items[2] == ('127.0.0.1:87', 9)
+
+        items = await p.get_list_async(20)
+        assert len(items) == 7
+        assert items[0] == ('127.0.0.1:80', 2)
+        assert await p.size_async() == 0
+
+        items = await p.get_list_async(1)
+        assert not items
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_test())
+
+    p = ProxyPooler(saver=conn) # sync saver runs in executor
+    loop.run_until_complete(p.put_list_async([('127.0.0.1:80', 2)]))
+    assert loop.run_until_complete(p.get_list_async(1)) == [('127.0.0.1:80', 2)]
+
 def test_connect(pooler, ssl_context):
 
     def client_send(data, queue, ssl_context):
@@ -225,6 +512,9 @@ def test_connect(pooler, ssl_context):
 
     client_send('get proxy', queue, ssl_context)
     assert p.size == 4
+    client_send('get 2 peek', queue, ssl_context)
+    assert len(queue.get_nowait()) == 2
+    assert p.size == 4
     client_send('get 3', queue, ssl_context)
     assert queue.get_nowait() == (('127.0.0.1:2018', 30), ('127.0.0.1:2019', 25), ('127.0.0.1:2020', 20))
     client_send('get 1', queue, ssl_context)
@@ -0,0 +1,47 @@
+from random import randint, random
+
+from proxypooler.scheduler import DueScheduler, TimingWheel
+
+
+def test_wheel():
+    wheel = TimingWheel(tick=1, slots=4, levels=2, now=100)
+    wheel.add('a', 101)
+    wheel.add('b', 105)
+    wheel.add('c', 150) # overflow
+    wheel.add('d', 90) # already due
+    assert len(wheel) == 4
+
+    assert wheel.advance(100) == [('d', 90)]
+    assert wheel.advance(104) == [('a', 101)]
+    wheel.add('a', 104.5)
+    assert sorted(wheel.advance(105)) == [('a', 104.5), ('b', 105)]
+    wheel.add('c', 106) # move from overflow
+    wheel.remove('a')
+    assert wheel.advance(200) == [('c', 106)]
+    assert len(wheel) == 0
+    assert wheel.current == 200
+
+def test_wheel_random():
+    now = 1000
+    wheel = TimingWheel(tick=1, slots=8, levels=3, now=now)
+    expires = {i: now + randint(0, 2000) + random() for i in range(5000)}
+    for item, expire in expires.items():
+        wheel.add(item, expire)
+
+    dispatched = {}
+    while len(wheel):
+        now += randint(1, 30)
+        for item, expire in wheel.advance(now):
+            assert expire <= now
+            assert expire > now - 31
+            dispatched[item] = expire
+    assert dispatched == expires
+
+def test_scheduler_notify():
+    scheduler = DueScheduler(max_wait=0)
+    scheduler.wait(100)
+    scheduler.notify([('a', 200)])
+    assert not scheduler._event.is_set()
+    scheduler.notify([('a', 200), ('b', 50)])
+    assert scheduler._event.is_set()
+    assert scheduler.next_due == 50
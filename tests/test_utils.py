@@ -0,0 +1,66 @@
+import os
+from time import sleep
+
+import pika.exceptions
+
+from proxypooler import config
+from proxypooler.utils import LogBuffer, LoggerBuffered, MQueue
+
+
+def test_log_buffer():
+    written = []
+    buffer = LogBuffer(lambda name, lvl, msg, *args, **kwargs: written.append((name, lvl, msg)),
+                       batch=10, size=1000)
+    logger = LoggerBuffered('test', buffer)
+    for i in range(100):
+        logger.info('msg {}'.format(i))
+    logger.error('failed', extra={'address': ''})
+
+    for _ in range(100):
+        if len(written) == 101:
+            break
+        sleep(0.01)
+    buffer.flush()
+    assert len(written) == 101
+    assert written[0] == ('test', 'info', 'msg 0')
+    assert written[-1] == ('test', 'error', 'failed')
+
+def test_log_buffer_full():
+    buffer = LogBuffer(lambda *args, **kwargs: None, size=2)
+    buffer._pid = os.getpid() # no writer thread
+    for i in range(5):
+        buffer.put(('test', 'info', 'msg', (), {}))
+    assert buffer.dropped == 3
+    buffer.flush()
+    assert buffer._queue.empty()
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.published = []
+        self.commits = 0
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append(body)
+
+    def tx_commit(self):
+        if self.fail:
+            self.fail -= 1
+            self.published.clear()
+            raise pika.exceptions.AMQPError('connection lost')
+        self.commits += 1
+
+def test_mqueue_batch(monkeypatch):
+    q = MQueue('pub', config.mq_url, 'test_exchange', 'test_queue', batch=10, flush=60)
+    channel = FakeChannel(fail=1)
+    monkeypatch.setattr(q, '_channel', lambda: channel)
+    for i in range(25):
+        q.put(str(i), 'test')
+    assert channel.commits == 2 # the first commit failed and was retried
+    assert len(channel.published) == 20
+    q.flush()
+    assert channel.commits == 3
+    assert channel.published == [str(i) for i in range(25)]
+    assert not q._pending